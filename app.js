@@ -112,7 +112,7 @@ async function login(event) {
         console.log('Login result:', result);
 
         if (result && result.success) {
-            currentUser = result.user;
+            currentUser = { ...result.user, token: result.token };
             localStorage.setItem('currentUser', JSON.stringify(currentUser));
             console.log('User logged in:', currentUser);
             showToast('Login successful!', 'success');
@@ -180,6 +180,9 @@ async function apiCall(endpoint, options = {}) {
             'Content-Type': 'application/json'
         }
     };
+    if (currentUser && currentUser.token) {
+        defaultOptions.headers['Authorization'] = `Bearer ${currentUser.token}`;
+    }
     
     try {
         console.log('API Call:', method=options.method || 'GET', url);
@@ -1,10 +1,50 @@
-from flask import Flask, request, jsonify, send_file, render_template_string
+from flask import Flask, request, jsonify, render_template_string, make_response, stream_with_context, g
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import OrderedDict, namedtuple
+from werkzeug.middleware.proxy_fix import ProxyFix
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+from sqlalchemy import event, tuple_, table, column, literal_column
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import Session, selectinload
+import base64
+import bisect
+import gzip
+import hashlib
+import heapq
+import html
+import math
 import os
+import re
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: the password hashing limit is then per process, not per host
+    fcntl = None
+
+try:
+    import numpy as np
+except ImportError:  # Optional: the in-memory catalog engine needs NumPy
+    np = None
+
+try:
+    import brotli
+except ImportError:  # Optional: without it responses are only gzip-compressed
+    brotli = None
+
+try:
+    import orjson
+except ImportError:  # Optional: without it JSON is encoded by the standard library
+    orjson = None
 
 # Initialize Flask app with static and template folders
 app = Flask(__name__, 
@@ -13,13 +53,104 @@ app = Flask(__name__,
 
 # Configure separate databases
 app.config['SQLALCHEMY_BINDS'] = {
-    'auth_db': 'sqlite:///auth.db',  # Database for users and passwords
-    'products_db': 'sqlite:///products.db'  # Database for products and orders
+    'auth_db': os.environ.get('AUTH_DATABASE_URL', 'sqlite:///auth.db'),  # Database for users and passwords
+    'products_db': os.environ.get('PRODUCTS_DATABASE_URL', 'sqlite:///products.db')  # Database for products and orders
 }
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///auth.db'  # Main database (auth)
+app.config['SQLALCHEMY_DATABASE_URI'] = app.config['SQLALCHEMY_BINDS']['auth_db']  # Main database (auth)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['JSON_SORT_KEYS'] = False
-app.config['SECRET_KEY'] = 'your-secret-key-change-in-production'
+DEFAULT_SECRET_KEY = 'your-secret-key-change-in-production'
+app.config['SECRET_KEY'] = os.environ.get('SHOP_SECRET_KEY', DEFAULT_SECRET_KEY)  # Signs login tokens; set it in production
+app.config['AUTH_TOKEN_TTL'] = 24 * 60 * 60  # Seconds a login token stays valid
+app.config['AUTH_REVOCATION_REFRESH'] = 5.0  # Seconds between reloads of revoked token versions from other workers
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('SHOP_PASSWORD_HASH_METHOD', 'scrypt')  # Werkzeug method spec, e.g. 'scrypt:32768:8:1' or 'pbkdf2:sha256:600000'
+# Password hashes in flight at once across every worker on the host; further logins/signups get a 503.
+# Keep it at or below the CPU count, and below workers x threads so the limit can actually bite.
+app.config['PASSWORD_HASH_CONCURRENCY'] = int(os.environ.get('SHOP_PASSWORD_HASH_CONCURRENCY', str(os.cpu_count() or 2)))
+app.config['PASSWORD_HASH_SLOT_DIR'] = os.environ.get('SHOP_PASSWORD_HASH_SLOT_DIR', os.path.join(tempfile.gettempdir(), 'shop-hash-slots'))
+app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('SHOP_PASSWORD_HASH_WORKERS', '0'))  # Hashing processes per worker; 0 hashes on the request thread
+app.config['PASSWORD_HASH_RETRY_AFTER'] = 1  # Seconds, sent with those 503s
+# Reverse proxies (load balancer, PaaS router) in front of the app that append to X-Forwarded-For.
+# 0 trusts none and uses the socket peer as the client IP; behind one load balancer set 1,
+# otherwise every client shares the balancer's address and its login throttle.
+app.config['TRUSTED_PROXY_HOPS'] = int(os.environ.get('SHOP_TRUSTED_PROXY_HOPS', '0'))
+app.config['AUTH_THROTTLE_WINDOW'] = 60  # Seconds in the login/signup sliding window
+app.config['AUTH_THROTTLE_IP_LIMIT'] = 30  # Login and signup attempts per client IP per window
+app.config['AUTH_THROTTLE_USER_LIMIT'] = 10  # Failed login and signup attempts per username per window
+app.config['AUTH_THROTTLE_MAX_KEYS'] = 100000  # In-memory counters per worker; least recently used are evicted
+# Keep throttle counters in auth_db so every worker shares them, instead of per worker in memory
+app.config['AUTH_THROTTLE_SHARED'] = os.environ.get('SHOP_AUTH_THROTTLE_SHARED', '0') == '1'
+app.config['USER_CACHE_SIZE'] = 10000  # User snapshots kept per worker
+app.config['USER_CACHE_TTL'] = 60  # Seconds
+app.config['USER_CACHE_REFRESH'] = 1.0  # Seconds between checks for user writes made by other workers
+app.config['PAGE_SIZE_DEFAULT'] = 50  # Rows per page when a list endpoint is paginated
+app.config['PAGE_SIZE_MAX'] = 200
+app.config['BATCH_IDS_MAX'] = 500  # Ids accepted by one multi-get request
+app.config['STREAM_BATCH_SIZE'] = 1000  # Rows fetched (and written) per chunk of an NDJSON stream
+app.config['SUGGEST_LIMIT_MAX'] = 20  # Completions returned by /api/search/suggest at most
+app.config['SUGGEST_SCAN_MAX'] = 20000  # Prefix matches ranked directly; more than this walks products in rank order instead
+app.config['SUGGEST_CACHE_SIZE'] = 5000  # Memoized suggest answers per worker
+app.config['FACET_PRICE_EDGES'] = [0, 10, 25, 50, 100, 250, 500, 1000]  # Lower bounds of the search price histogram buckets
+app.config['IDEMPOTENCY_TTL'] = 24 * 60 * 60  # Seconds a stored Idempotency-Key response stays replayable
+app.config['IDEMPOTENCY_CACHE_SIZE'] = 10000  # Completed keys kept in the in-process LRU
+app.config['IDEMPOTENCY_LEASE'] = 90  # Seconds an unfinished claim blocks retries; a few gunicorn timeouts
+# Serve catalog listings from the in-memory columnar engine (requires NumPy)
+app.config['CATALOG_ENGINE'] = os.environ.get('SHOP_CATALOG_ENGINE', '0') == '1'
+app.config['CATALOG_REFRESH_INTERVAL'] = 1.0  # Seconds between checks for other workers' product writes
+app.config['RESPONSE_CACHE_SIZE'] = 2000  # Cached GET responses per worker
+app.config['RESPONSE_CACHE_TTL'] = 60  # Seconds
+app.config['RESPONSE_CACHE_TAGS'] = 20000  # Tag generations kept before they are pruned
+app.config['COMPRESS_MIN_SIZE'] = 1024  # Bytes; smaller API responses are sent as-is
+app.config['COMPRESS_LEVEL'] = 6  # gzip level for API responses
+app.config['COMPRESS_BROTLI_QUALITY'] = 5  # Brotli quality for API responses
+app.config['COMPRESS_MIMETYPES'] = ['application/json']
+
+if app.config['TRUSTED_PROXY_HOPS']:
+    # request.remote_addr (and the scheme) then come from the trusted proxies' forwarded headers
+    hops = app.config['TRUSTED_PROXY_HOPS']
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops)
+
+
+# ==================== JSON ENCODING ====================
+
+class FastJSONProvider(DefaultJSONProvider):
+    """JSON provider that encodes with orjson when it is installed.
+
+    Dates and other non-native types still go through the default provider's
+    hook, so the output is the same either way; anything orjson refuses
+    (e.g. integers wider than 64 bits) falls back to the standard encoder.
+    """
+
+    def _orjson(self, obj, pretty=False):
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option)
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        try:
+            return self._orjson(obj).decode()
+        except orjson.JSONEncodeError:
+            return super().dumps(obj)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        pretty = self.compact is False or (self.compact is None and self._app.debug)
+        try:
+            body = self._orjson(obj, pretty)
+        except orjson.JSONEncodeError:
+            return super().response(obj)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+app.json = FastJSONProvider(app)
+app.json.sort_keys = app.config['JSON_SORT_KEYS']  # Flask 3 no longer reads this setting itself
 
 # Initialize database
 db = SQLAlchemy(app)
@@ -35,7 +166,7 @@ class User(db.Model):
     password_hash = db.Column(db.String(255), nullable=False)
     full_name = db.Column(db.String(120))
     phone = db.Column(db.String(20))
-    role = db.Column(db.String(20), default='buyer')  # 'buyer', 'seller', 'admin'
+    role = db.Column(db.String(20), default='buyer', index=True)  # 'buyer', 'seller', 'admin'
     shop_name = db.Column(db.String(120))  # For sellers
     shop_description = db.Column(db.Text)  # For sellers
     status = db.Column(db.String(20), default='active')  # 'active', 'inactive', 'banned'
@@ -43,10 +174,10 @@ class User(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
 
     def to_dict(self):
         return {
@@ -66,6 +197,12 @@ class User(db.Model):
 
 class Product(db.Model):
     __bind_key__ = 'products_db'  # Store in products database
+    __table_args__ = (
+        db.Index('ix_product_created', 'createdAt', 'id'),
+        db.Index('ix_product_uploader_created', 'uploader_id', 'createdAt', 'id'),
+        db.Index('ix_product_category_created', 'category', 'createdAt', 'id'),
+        db.Index('ix_product_category_price', 'category', 'sortPrice'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(255), nullable=False)
     category = db.Column(db.String(100), nullable=False)
@@ -81,30 +218,101 @@ class Product(db.Model):
     uploader_id = db.Column(db.Integer, nullable=False)  # Reference to User.id from auth_db
     uploader_name = db.Column(db.String(120))  # Seller/uploader name
     createdAt = db.Column(db.DateTime, default=datetime.utcnow)
+    sortPrice = db.Column(db.Float, index=True)  # Effective price shared by fixed and range listings
+    sortPriceHigh = db.Column(db.Float, index=True)  # Same, but the high end of a range; price-high sorts by it
+    # Rating aggregates, maintained by add_rating and rebuilt by `flask rebuild-ratings`
+    rating_count = db.Column(db.Integer, nullable=False, default=0)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+    rating_1 = db.Column(db.Integer, nullable=False, default=0)  # Number of 1-star ratings
+    rating_2 = db.Column(db.Integer, nullable=False, default=0)
+    rating_3 = db.Column(db.Integer, nullable=False, default=0)
+    rating_4 = db.Column(db.Integer, nullable=False, default=0)
+    rating_5 = db.Column(db.Integer, nullable=False, default=0)
     ratings = db.relationship('Rating', backref='product', lazy=True, cascade='all, delete-orphan')
 
+    def effective_price(self):
+        """Price used for sorting and range filters: the fixed price, or the low end of a range"""
+        if self.priceType == 'range':
+            return self.priceMin if self.priceMin is not None else self.price
+        return self.price if self.price is not None else self.priceMin
+
+    def effective_high_price(self):
+        """Price used for the price-high ordering: the fixed price, or the high end of a range"""
+        if self.priceType == 'range':
+            return self.priceMax if self.priceMax is not None else self.price
+        return self.price if self.price is not None else self.priceMax
+
+    def rating_summary(self):
+        return rating_summary(self.rating_count, self.rating_sum, self.rating_1, self.rating_2,
+                              self.rating_3, self.rating_4, self.rating_5)
+
     def to_dict(self):
-        return {
-            'id': self.id,
-            'name': self.name,
-            'category': self.category,
-            'description': self.description,
-            'priceType': self.priceType,
-            'price': self.price,
-            'priceMin': self.priceMin,
-            'priceMax': self.priceMax,
-            'email': self.email,
-            'phone': self.phone,
-            'whatsapp': self.whatsapp,
-            'contactMethods': self.contactMethods.split(',') if self.contactMethods else [],
-            'uploader_id': self.uploader_id,
-            'uploader_name': self.uploader_name,
-            'createdAt': self.createdAt.strftime('%Y-%m-%d %H:%M:%S')
-        }
+        return product_row_dict([getattr(self, column.key) for column in PRODUCT_COLUMNS])
+
+
+@event.listens_for(Product, 'before_insert')
+@event.listens_for(Product, 'before_update')
+def sync_sort_price(mapper, connection, product):
+    """Keep Product.sortPrice and sortPriceHigh in step with the price columns on every write"""
+    product.sortPrice = product.effective_price()
+    product.sortPriceHigh = product.effective_high_price()
+
+
+# Columns the product API dict is built from; list endpoints select these as
+# plain row tuples instead of ORM instances (no identity map or attribute
+# instrumentation). Mapped attributes rather than bare table columns so the
+# session still routes the query to the products bind.
+PRODUCT_COLUMNS = (
+    Product.id, Product.name, Product.category, Product.description, Product.priceType,
+    Product.price, Product.priceMin, Product.priceMax, Product.email, Product.phone,
+    Product.whatsapp, Product.contactMethods, Product.uploader_id, Product.uploader_name,
+    Product.createdAt, Product.rating_count, Product.rating_sum,
+    Product.rating_1, Product.rating_2, Product.rating_3, Product.rating_4, Product.rating_5
+)
+
+
+def rating_summary(count, total, r1, r2, r3, r4, r5):
+    """Public rating dict from a product's stored aggregates"""
+    count = count or 0
+    return {
+        'count': count,
+        'average': round(total / count, 2) if count else None,
+        'histogram': {'1': r1 or 0, '2': r2 or 0, '3': r3 or 0, '4': r4 or 0, '5': r5 or 0}
+    }
+
+
+def product_row_dict(row):
+    """Serialize a PRODUCT_COLUMNS row (extra trailing columns are ignored).
+
+    Unpacks positionally: attribute access on a Row costs far more than
+    building the dict itself.
+    """
+    (product_id, name, category, description, price_type, price, price_min, price_max,
+     email, phone, whatsapp, contact_methods, uploader_id, uploader_name, created_at,
+     rating_count, rating_sum, r1, r2, r3, r4, r5, *_) = row
+    return {
+        'id': product_id,
+        'name': name,
+        'category': category,
+        'description': description,
+        'priceType': price_type,
+        'price': price,
+        'priceMin': price_min,
+        'priceMax': price_max,
+        'email': email,
+        'phone': phone,
+        'whatsapp': whatsapp,
+        'contactMethods': contact_methods.split(',') if contact_methods else [],
+        'uploader_id': uploader_id,
+        'uploader_name': uploader_name,
+        'createdAt': created_at.isoformat(' ', 'seconds'),  # Same as '%Y-%m-%d %H:%M:%S', several times cheaper
+        'rating': rating_summary(rating_count, rating_sum, r1, r2, r3, r4, r5)
+    }
 
 
 class CartItem(db.Model):
     __bind_key__ = 'products_db'  # Store in products database
+    __table_args__ = (db.Index('ix_cart_item_user_product', 'userId', 'productId'),)
     id = db.Column(db.Integer, primary_key=True)
     userId = db.Column(db.Integer, nullable=False)  # Reference to User.id from auth_db
     productId = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
@@ -121,6 +329,7 @@ class CartItem(db.Model):
 
 class Order(db.Model):
     __bind_key__ = 'products_db'  # Store in products database
+    __table_args__ = (db.Index('ix_order_user_created', 'userId', 'createdAt', 'id'),)
     id = db.Column(db.Integer, primary_key=True)
     userId = db.Column(db.Integer, nullable=False)  # Reference to User.id from auth_db
     items = db.relationship('OrderItem', backref='order', lazy=True, cascade='all, delete-orphan')
@@ -143,7 +352,7 @@ class Order(db.Model):
 class OrderItem(db.Model):
     __bind_key__ = 'products_db'  # Store in products database
     id = db.Column(db.Integer, primary_key=True)
-    orderId = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
+    orderId = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False, index=True)
     productId = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
     name = db.Column(db.String(255), nullable=False)
     quantity = db.Column(db.Integer, default=1)
@@ -161,8 +370,8 @@ class OrderItem(db.Model):
 class Rating(db.Model):
     __bind_key__ = 'products_db'  # Store in products database
     id = db.Column(db.Integer, primary_key=True)
-    productId = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
-    userId = db.Column(db.Integer, nullable=False)  # Reference to User.id from auth_db
+    productId = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False, index=True)
+    userId = db.Column(db.Integer, nullable=False, index=True)  # Reference to User.id from auth_db
     rating = db.Column(db.Integer)
     review = db.Column(db.Text)
     createdAt = db.Column(db.DateTime, default=datetime.utcnow)
@@ -181,6 +390,7 @@ class Rating(db.Model):
 
 class Coupon(db.Model):
     __bind_key__ = 'products_db'  # Store in products database
+    __table_args__ = (db.Index('ix_coupon_code_active', 'code', 'active'),)
     id = db.Column(db.Integer, primary_key=True)
     code = db.Column(db.String(50), unique=True, nullable=False)
     discount = db.Column(db.Integer, nullable=False)  # Discount percentage
@@ -218,9 +428,2016 @@ class UserProfile(db.Model):
         }
 
 
+class CatalogChange(db.Model):
+    """Append-only log of product writes, filled by triggers; MAX(id) is the catalog version"""
+    __bind_key__ = 'products_db'  # Store in products database
+    __table_args__ = {'sqlite_autoincrement': True}  # Versions must never be reused after pruning
+    id = db.Column(db.Integer, primary_key=True)
+    productId = db.Column(db.Integer, nullable=False)
+    changedAt = db.Column(db.DateTime, server_default=db.func.current_timestamp())
+
+
+class IdempotencyKey(db.Model):
+    __bind_key__ = 'products_db'  # Store in products database
+    __table_args__ = (db.UniqueConstraint('scope', 'key', name='uq_idempotency_scope_key'),)
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(120), nullable=False)  # 'POST /api/orders'
+    key = db.Column(db.String(255), nullable=False)  # Client-supplied Idempotency-Key header
+    requestHash = db.Column(db.String(64), nullable=False)  # SHA-256 of the request body
+    statusCode = db.Column(db.Integer)  # NULL while the first request is still running
+    responseBody = db.Column(db.Text)
+    createdAt = db.Column(db.DateTime, default=datetime.utcnow)
+    claimedAt = db.Column(db.DateTime)  # When the running request took the key; retries may take over after the lease
+    expiresAt = db.Column(db.DateTime, nullable=False, index=True)
+
+
+class AuthRevocation(db.Model):
+    __bind_key__ = 'auth_db'  # Store in auth database
+    userId = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)  # Tokens issued with a lower version are revoked
+    updatedAt = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class AuthThrottleCounter(db.Model):
+    __bind_key__ = 'auth_db'  # Store in auth database
+    key = db.Column(db.String(200), primary_key=True)  # 'ip:<address>' or 'user:<username>'
+    bucket = db.Column(db.Integer, nullable=False)  # Window number the count belongs to
+    count = db.Column(db.Integer, nullable=False, default=0)  # Attempts in that window
+    previous = db.Column(db.Integer, nullable=False, default=0)  # Attempts in the window before it
+
+
+class UserCacheStamp(db.Model):
+    __bind_key__ = 'auth_db'  # Store in auth database
+    id = db.Column(db.Integer, primary_key=True)  # Single row
+    version = db.Column(db.Integer, nullable=False, default=0)  # Bumped on every user write
+
+
+def user_cache_stamp():
+    """Current user write stamp, shared by every worker"""
+    with Session(db.engines['auth_db']) as session:
+        return session.query(UserCacheStamp.version).scalar() or 0
+
+
+# ==================== PAGINATION HELPERS ====================
+
+def encode_cursor(created_at, row_id):
+    """Encode a (createdAt, id) position as an opaque URL-safe cursor"""
+    raw = f"{created_at.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by encode_cursor, raising ValueError if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, row_id = raw.split('|')
+        return datetime.fromisoformat(created_at), int(row_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def float_arg(name):
+    """Read an optional finite float query arg, raising ValueError on bad input"""
+    value = request.args.get(name)
+    if value in (None, ''):
+        return None
+    number = float(value)
+    if number != number or number in (float('inf'), float('-inf')):
+        raise ValueError('Invalid number')
+    return number
+
+
+def id_list_arg(name='ids'):
+    """Read a comma-separated id list query arg (deduplicated, in order), or None when absent.
+
+    Raises ValueError on non-integer ids or more than BATCH_IDS_MAX of them.
+    """
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        ids = list(dict.fromkeys(int(part) for part in value.split(',') if part.strip()))
+    except ValueError:
+        raise ValueError('Invalid ids')
+    if not ids:
+        raise ValueError('No ids given')
+    if len(ids) > app.config['BATCH_IDS_MAX']:
+        raise ValueError(f'Too many ids (max {app.config["BATCH_IDS_MAX"]})')
+    return ids
+
+
+def wants_pagination():
+    """Pagination is opt-in so existing clients still receive the full list"""
+    return 'limit' in request.args or 'cursor' in request.args
+
+
+def parse_page_args():
+    """Read limit/cursor/count query args.
+
+    Returns (limit, position, with_total). Raises ValueError on bad input.
+    """
+    try:
+        limit = int(request.args.get('limit', app.config['PAGE_SIZE_DEFAULT']))
+    except ValueError:
+        raise ValueError('Invalid limit')
+    if limit < 1:
+        raise ValueError('Invalid limit')
+    limit = min(limit, app.config['PAGE_SIZE_MAX'])
+
+    cursor = request.args.get('cursor')
+    position = decode_cursor(cursor) if cursor else None
+
+    # The total is a single indexed COUNT, but callers paging through a huge
+    # result can skip it entirely with count=0
+    with_total = request.args.get('count', '1').lower() not in ('0', 'false', 'no')
+    return limit, position, with_total
+
+
+def keyset_page(query, created_col, id_col, limit, position=None):
+    """Fetch one newest-first page ordered by (created_col, id_col).
+
+    Seeks past the cursor position with a row-value comparison instead of
+    OFFSET, so every page costs the same no matter how deep it is.
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    if position:
+        query = query.filter(tuple_(created_col, id_col) < tuple_(*position))
+
+    rows = query.order_by(created_col.desc(), id_col.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, created_col.key), getattr(last, id_col.key))
+    return rows, next_cursor
+
+
+def count_rows(query, id_col):
+    """Cheap total for a filtered query: COUNT(id) without ORDER BY or entity loading"""
+    return query.order_by(None).with_entities(db.func.count(id_col)).scalar() or 0
+
+
+def product_listing(query, **filters):
+    """Build the products part of a listing response.
+
+    Answers from the in-memory catalog engine (with the given filters) when
+    it is enabled and from `query` otherwise. Paginated when the request has
+    limit/cursor and limited to ?fields= when given; raises ValueError on bad
+    paging args or unknown fields.
+    """
+    keys = PRODUCT_FIELDS.requested()
+    paginate = wants_pagination()
+    limit, position, with_total = parse_page_args() if paginate else (None, None, False)
+    columns, serialize = product_selection(keys)
+
+    if catalog_engine_active():
+        rows, total, next_position = catalog_engine.query(position=position, limit=limit, **filters)
+        next_cursor = encode_cursor(*next_position) if next_position else None
+        if keys:
+            rows = [project(row, keys) for row in rows]
+    elif paginate:
+        page, next_cursor = keyset_page(query.with_entities(*columns), Product.createdAt, Product.id, limit, position)
+        rows = [serialize(row) for row in page]
+        total = count_rows(query, Product.id) if with_total else None
+    else:
+        rows = [serialize(row) for row in query.with_entities(*columns)]
+
+    if not paginate:
+        return {'products': rows}
+    listing = {'products': rows, 'next_cursor': next_cursor}
+    if with_total:
+        listing['total'] = total
+    return listing
+
+
+# ==================== SPARSE FIELDSETS ====================
+
+def format_timestamp(value):
+    """'%Y-%m-%d %H:%M:%S' without the cost of strftime"""
+    return value.isoformat(' ', 'seconds')
+
+
+class FieldSet:
+    """The fields a resource can be serialized with, for ?fields=a,b,c.
+
+    `fields` maps each API key to (columns, convert): the columns it is
+    computed from and a function of their values (None passes a single
+    value through). A key with no columns is filled in by the endpoint.
+    """
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def requested(self):
+        """Keys named by ?fields=, or None when absent; ValueError on unknown names"""
+        value = request.args.get('fields')
+        if value is None:
+            return None
+        keys = list(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+        unknown = [key for key in keys if key not in self.fields]
+        if unknown:
+            raise ValueError(f'Unknown field(s): {", ".join(unknown)}')
+        if not keys:
+            raise ValueError('No fields requested')
+        return keys
+
+    def columns(self, keys, *extra):
+        """Columns to select for keys plus any extra (e.g. ordering) columns, deduplicated"""
+        columns = {}
+        for column in [column for key in keys for column in self.fields[key][0]] + list(extra):
+            columns.setdefault(column.key, column)
+        return tuple(columns.values())
+
+    def serializer(self, keys, columns):
+        """Function turning a row selected with `columns` into a dict of keys"""
+        position = {column.key: i for i, column in enumerate(columns)}
+        plan = []
+        for key in keys:
+            key_columns, convert = self.fields[key]
+            if key_columns:
+                plan.append((key, [position[column.key] for column in key_columns], convert))
+            else:
+                plan.append((key, None, None))
+
+        def serialize(row):
+            data = {}
+            for key, indexes, convert in plan:
+                if indexes is None:
+                    data[key] = None  # Placeholder keeps the key order for the endpoint to fill
+                elif convert is None:
+                    data[key] = row[indexes[0]]
+                else:
+                    data[key] = convert(*[row[i] for i in indexes])
+            return data
+        return serialize
+
+
+def project(data, keys):
+    """Subset of an already-serialized dict"""
+    return {key: data[key] for key in keys}
+
+
+def split_contact_methods(value):
+    return value.split(',') if value else []
+
+
+PRODUCT_FIELDS = FieldSet({
+    'id': ((Product.id,), None),
+    'name': ((Product.name,), None),
+    'category': ((Product.category,), None),
+    'description': ((Product.description,), None),
+    'priceType': ((Product.priceType,), None),
+    'price': ((Product.price,), None),
+    'priceMin': ((Product.priceMin,), None),
+    'priceMax': ((Product.priceMax,), None),
+    'email': ((Product.email,), None),
+    'phone': ((Product.phone,), None),
+    'whatsapp': ((Product.whatsapp,), None),
+    'contactMethods': ((Product.contactMethods,), split_contact_methods),
+    'uploader_id': ((Product.uploader_id,), None),
+    'uploader_name': ((Product.uploader_name,), None),
+    'createdAt': ((Product.createdAt,), format_timestamp),
+    'rating': ((Product.rating_count, Product.rating_sum, Product.rating_1, Product.rating_2,
+                Product.rating_3, Product.rating_4, Product.rating_5), rating_summary)
+})
+
+USER_FIELDS = FieldSet({
+    'id': ((User.id,), None),
+    'username': ((User.username,), None),
+    'email': ((User.email,), None),
+    'full_name': ((User.full_name,), None),
+    'phone': ((User.phone,), None),
+    'role': ((User.role,), None),
+    'shop_name': ((User.shop_name,), None),
+    'shop_description': ((User.shop_description,), None),
+    'status': ((User.status,), None),
+    'canUploadStock': ((User.canUploadStock,), None),
+    'created_at': ((User.created_at,), format_timestamp)
+})
+
+# Line counts for the summary view, as correlated per-order subqueries that
+# ride ix_order_item_orderId and only touch the items of the orders selected
+ORDER_ITEM_COUNT = db.select(db.func.count(OrderItem.id)).where(
+    OrderItem.orderId == Order.id).correlate(Order).scalar_subquery().label('item_count')
+ORDER_TOTAL_QUANTITY = db.select(db.func.sum(OrderItem.quantity)).where(
+    OrderItem.orderId == Order.id).correlate(Order).scalar_subquery().label('total_quantity')
+
+ORDER_FIELDS = FieldSet({
+    'id': ((Order.id,), None),
+    'items': ((), None),  # Batch-loaded by the endpoint
+    'total': ((Order.total,), None),
+    'status': ((Order.status,), None),
+    'date': ((Order.createdAt,), format_timestamp),
+    'discountApplied': ((Order.discountApplied,), None),
+    'item_count': ((ORDER_ITEM_COUNT,), None),
+    'total_quantity': ((ORDER_TOTAL_QUANTITY,), lambda quantity: quantity or 0)
+})
+ORDER_SUMMARY_KEYS = ['id', 'total', 'status', 'date', 'discountApplied', 'item_count', 'total_quantity']
+
+
+def product_selection(keys):
+    """(columns, serialize) for product rows with the given keys (None = all).
+
+    Sparse selections always carry createdAt and id so keyset cursors work.
+    """
+    if keys is None:
+        return PRODUCT_COLUMNS, product_row_dict
+    columns = PRODUCT_FIELDS.columns(keys, Product.createdAt, Product.id)
+    return columns, PRODUCT_FIELDS.serializer(keys, columns)
+
+
+def order_items_by_order(order_ids):
+    """Item dicts for many orders in one IN query, keyed by order id"""
+    items = {order_id: [] for order_id in order_ids}
+    lines = db.session.query(OrderItem.orderId, OrderItem.name, OrderItem.quantity, OrderItem.price) \
+        .filter(OrderItem.orderId.in_(order_ids)).order_by(OrderItem.id)
+    for order_id, name, quantity, price in lines:
+        items[order_id].append({'name': name, 'quantity': quantity, 'price': price})
+    return items
+
+
+# ==================== STREAMING RESPONSES ====================
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+def wants_stream():
+    """True when the client asked for NDJSON: ?stream=1 or Accept: application/x-ndjson"""
+    if request.args.get('stream', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+
+def ndjson_response(query, serialize):
+    """Stream query results as NDJSON, one serialized row per line.
+
+    Rows are fetched with yield_per and written out a batch at a time, so
+    worker memory stays flat no matter how many rows match.
+    """
+    batch_size = app.config['STREAM_BATCH_SIZE']
+    dumps = app.json.dumps
+
+    def generate():
+        lines = []
+        for row in query.yield_per(batch_size):
+            lines.append(dumps(serialize(row)))
+            if len(lines) >= batch_size:
+                yield '\n'.join(lines) + '\n'
+                lines = []
+        if lines:
+            yield '\n'.join(lines) + '\n'
+
+    return app.response_class(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+
+
+# ==================== FULL-TEXT SEARCH INDEX ====================
+
+# External-content FTS5 index over product name/description. The triggers keep
+# it in step with the product table on every insert, update and delete, so no
+# endpoint has to maintain it by hand.
+PRODUCT_FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS product_fts USING fts5(
+        name, description,
+        content='product', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS product_fts_ai AFTER INSERT ON product BEGIN
+        INSERT INTO product_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS product_fts_ad AFTER DELETE ON product BEGIN
+        INSERT INTO product_fts(product_fts, rowid, name, description) VALUES ('delete', old.id, old.name, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS product_fts_au AFTER UPDATE OF name, description ON product BEGIN
+        INSERT INTO product_fts(product_fts, rowid, name, description) VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO product_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END""",
+]
+
+product_fts = table('product_fts', column('rowid'), column('name'), column('description'))
+
+# None until first checked in this process; then True/False
+fts_state = {'available': None}
+
+
+def fts_available():
+    """Whether products.db has a usable FTS5 index (checked once per process)"""
+    if fts_state['available'] is None:
+        try:
+            with db.engines['products_db'].connect() as conn:
+                fts_state['available'] = conn.exec_driver_sql(
+                    "SELECT 1 FROM sqlite_master WHERE type='table' AND name='product_fts'"
+                ).first() is not None
+        except OperationalError:
+            fts_state['available'] = False
+    return fts_state['available']
+
+
+def fts_match_expression(query):
+    """Build an FTS5 MATCH string where every word must match as a prefix"""
+    terms = re.findall(r'\w+', query)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def highlight_snippet(snippet):
+    """Escape a raw FTS5 snippet and turn its match markers into <mark> tags"""
+    if not snippet:
+        return ''
+    return html.escape(snippet).replace('\x02', '<mark>').replace('\x03', '</mark>')
+
+
+# ==================== IN-PROCESS CACHE ====================
+
+class LRUCache:
+    """Thread-safe LRU mapping with an optional per-entry TTL (in seconds)"""
+
+    def __init__(self, max_size, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at or None, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            return default if entry is None else entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# ==================== IDEMPOTENCY KEYS ====================
+
+# Completed responses by (scope, key); the IdempotencyKey table is the source of truth
+idempotency_cache = LRUCache(app.config['IDEMPOTENCY_CACHE_SIZE'], ttl=app.config['IDEMPOTENCY_TTL'])
+idempotency_state = {'claims': 0}
+IDEMPOTENCY_PURGE_EVERY = 500  # Claims between sweeps of expired rows
+
+
+def replay_response(status_code, body):
+    response = make_response(body, status_code)
+    response.mimetype = 'application/json'
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def purge_expired_idempotency_keys():
+    IdempotencyKey.query.filter(IdempotencyKey.expiresAt < datetime.utcnow()).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def take_over_idempotency_claim(claim_id, now):
+    """Claim an unfinished key whose lease has run out; False if it is still held"""
+    cutoff = now - timedelta(seconds=app.config['IDEMPOTENCY_LEASE'])
+    taken = IdempotencyKey.query.filter(
+        IdempotencyKey.id == claim_id,
+        IdempotencyKey.statusCode.is_(None),
+        db.or_(IdempotencyKey.claimedAt.is_(None), IdempotencyKey.claimedAt <= cutoff)
+    ).update({'claimedAt': now}, synchronize_session=False)
+    db.session.commit()
+    return bool(taken)
+
+
+def idempotent(handler):
+    """Honour an Idempotency-Key header on a write endpoint.
+
+    The first request claims the key before running the handler; a retry
+    with the same key gets the stored response replayed without running the
+    handler again, and a retry that arrives while the first is still running
+    gets 409. Server errors release the key so the client can try again.
+    A claim left unfinished for IDEMPOTENCY_LEASE seconds (its worker was
+    killed mid-request) is taken over by the next matching retry.
+    """
+    @wraps(handler)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return handler(*args, **kwargs)
+        if len(key) > 255:
+            return jsonify({'success': False, 'error': 'Idempotency-Key too long'}), 400
+
+        scope = f"{request.method} {request.path}"
+        request_hash = hashlib.sha256(request.get_data()).hexdigest()
+        mismatch = jsonify({'success': False, 'error': 'Idempotency-Key reused with a different request'}), 422
+
+        cached = idempotency_cache.get((scope, key))
+        if cached:
+            cached_hash, status_code, body = cached
+            return mismatch if cached_hash != request_hash else replay_response(status_code, body)
+
+        now = datetime.utcnow()
+        claim = IdempotencyKey(
+            scope=scope, key=key, requestHash=request_hash, claimedAt=now,
+            expiresAt=now + timedelta(seconds=app.config['IDEMPOTENCY_TTL'])
+        )
+        try:
+            db.session.add(claim)
+            db.session.commit()
+            claim_id = claim.id
+        except IntegrityError:
+            db.session.rollback()
+            existing = IdempotencyKey.query.filter_by(scope=scope, key=key).first()
+            if existing and existing.expiresAt <= now:
+                # Stale row the purge has not reached yet: drop it and claim afresh
+                db.session.delete(existing)
+                db.session.commit()
+                return wrapper(*args, **kwargs)
+            if not existing:
+                return jsonify({'success': False, 'error': 'A request with this Idempotency-Key is in progress'}), 409
+            if existing.requestHash != request_hash:
+                return mismatch
+            if existing.statusCode is None:
+                if not take_over_idempotency_claim(existing.id, now):
+                    return jsonify({'success': False, 'error': 'A request with this Idempotency-Key is in progress'}), 409
+                claim_id = existing.id
+            else:
+                idempotency_cache.set((scope, key), (existing.requestHash, existing.statusCode, existing.responseBody))
+                return replay_response(existing.statusCode, existing.responseBody)
+
+        try:
+            response = make_response(handler(*args, **kwargs))
+        except Exception:
+            db.session.rollback()
+            IdempotencyKey.query.filter_by(id=claim_id).delete()
+            db.session.commit()
+            raise
+
+        if response.status_code >= 500:
+            IdempotencyKey.query.filter_by(id=claim_id).delete()
+        else:
+            body = response.get_data(as_text=True)
+            IdempotencyKey.query.filter_by(id=claim_id).update(
+                {'statusCode': response.status_code, 'responseBody': body}
+            )
+            idempotency_cache.set((scope, key), (request_hash, response.status_code, body))
+        db.session.commit()
+
+        idempotency_state['claims'] += 1
+        if idempotency_state['claims'] % IDEMPOTENCY_PURGE_EVERY == 0:
+            purge_expired_idempotency_keys()
+        return response
+    return wrapper
+
+
+# ==================== IN-MEMORY CATALOG ENGINE ====================
+
+# Every insert, update or delete on product appends to catalog_change, so any
+# worker can tell which products changed since the version it last saw.
+CATALOG_CHANGE_DDL = [
+    """CREATE TRIGGER IF NOT EXISTS catalog_change_ai AFTER INSERT ON product BEGIN
+        INSERT INTO catalog_change(productId) VALUES (new.id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS catalog_change_au AFTER UPDATE ON product BEGIN
+        INSERT INTO catalog_change(productId) VALUES (new.id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS catalog_change_ad AFTER DELETE ON product BEGIN
+        INSERT INTO catalog_change(productId) VALUES (old.id);
+    END""",
+]
+CATALOG_CHANGES_KEPT = 10000  # Engines further behind than this rebuild from scratch
+CATALOG_PRUNE_EVERY = 1000  # Product writes between prunes of the change log
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def to_micros(moment):
+    return (moment - EPOCH) // timedelta(microseconds=1)
+
+
+def from_micros(micros):
+    return EPOCH + timedelta(microseconds=int(micros))
+
+
+class CatalogReadModel:
+    """In-process read model of the product table fed by the catalog_change log.
+
+    Syncs at most once per refresh interval, or on the next read after a
+    write in this process, reloading only the products that changed. Full
+    builds (first load, compaction, or falling behind the pruned log) run in
+    a background thread on a separate copy that is swapped in when done, so
+    readers keep the previous state, or on first load fall back to whatever
+    they do without the model, instead of waiting on the lock.
+    Subclasses implement _reset(capacity), _put(product) and _remove(product_id).
+    """
+
+    def __init__(self, refresh_interval):
+        self.refresh_interval = refresh_interval
+        self.lock = threading.RLock()
+        self.builder = None  # Thread running a full build, if any
+        self.version = None  # catalog_change id the model reflects; None until loaded
+        self.checked_at = 0.0
+        self._reset(0)
+
+    def _needs_compaction(self):
+        return False
+
+    def _rebuild(self, session, version):
+        count = session.query(db.func.count(Product.id)).scalar() or 0
+        self._reset(count)
+        for product in session.query(Product).yield_per(1000):
+            self._put(product)
+        self.version = version
+
+    def invalidate(self):
+        """Make the next read check for changes instead of waiting out the interval"""
+        self.checked_at = 0.0
+
+    def building(self):
+        return self.builder is not None and self.builder.is_alive()
+
+    def start(self):
+        """Begin a full build in the background unless one is already running"""
+        with self.lock:
+            if not self.building():
+                self.builder = threading.Thread(target=self._build, name=type(self).__name__, daemon=True)
+                self.builder.start()
+
+    def _build(self):
+        try:
+            with app.app_context(), Session(db.engines['products_db']) as session:
+                latest = session.query(db.func.max(CatalogChange.id)).scalar() or 0
+                fresh = object.__new__(type(self))  # Holds only the state _rebuild fills in
+                fresh._rebuild(session, latest)
+            with self.lock:
+                self.__dict__.update(vars(fresh))
+                self.checked_at = 0.0  # Pick up writes made during the build on the next read
+        except Exception as e:
+            print(f"{type(self).__name__} build failed: {e}")
+
+    def ready(self):
+        """Whether the model has loaded; starts loading it if not"""
+        self.sync()
+        return self.version is not None
+
+    def sync(self, wait=False):
+        """Catch up with product writes made by any worker since the last sync.
+
+        Pass wait=True to block until the first load finishes rather than
+        read an empty model.
+        """
+        if not self.building() and (
+                self.version is None or time.monotonic() - self.checked_at >= self.refresh_interval):
+            self._catch_up()
+        builder = self.builder
+        if wait and self.version is None and builder is not None:
+            builder.join()
+
+    def _catch_up(self):
+        with self.lock, Session(db.engines['products_db']) as session:
+            oldest, latest = session.query(db.func.min(CatalogChange.id), db.func.max(CatalogChange.id)).one()
+            latest = latest or 0
+            behind = self.version is None or (oldest is not None and oldest > self.version + 1)
+            if behind or self._needs_compaction():
+                self.start()  # Readers keep the current state until the new one is swapped in
+                return
+            if latest != self.version:
+                changed = [row[0] for row in session.query(CatalogChange.productId).filter(
+                    CatalogChange.id > self.version, CatalogChange.id <= latest
+                ).distinct()]
+                found = set()
+                for start in range(0, len(changed), 500):
+                    for product in session.query(Product).filter(Product.id.in_(changed[start:start + 500])):
+                        self._put(product)
+                        found.add(product.id)
+                for product_id in changed:
+                    if product_id not in found:
+                        self._remove(product_id)
+                self.version = latest
+            self.checked_at = time.monotonic()
+
+
+class CatalogEngine(CatalogReadModel):
+    """Columnar read model of the product table.
+
+    Keeps the filter and sort keys as parallel NumPy arrays next to the
+    ready-made to_dict() rows, so listing, filtering and top-k run as vector
+    operations without touching SQLite.
+    """
+
+    def _reset(self, capacity):
+        self.size = 0
+        self.dead = 0
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.created = np.zeros(capacity, dtype=np.int64)  # Microseconds since the epoch
+        self.seller = np.zeros(capacity, dtype=np.int64)
+        self.category = np.zeros(capacity, dtype=np.int32)
+        self.price = np.full(capacity, np.nan)  # sortPrice; NaN where unpriced
+        self.price_high = np.full(capacity, np.nan)  # sortPriceHigh
+        self.rating = np.zeros(capacity)  # Average stars; 0 when unrated
+        self.rating_count = np.zeros(capacity, dtype=np.int64)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.rows = []
+        self.slots = {}  # product id -> array index
+        self.category_codes = {}
+
+    def _grow(self):
+        extra = max(1024, len(self.ids))
+        self.ids = np.concatenate([self.ids, np.zeros(extra, dtype=np.int64)])
+        self.created = np.concatenate([self.created, np.zeros(extra, dtype=np.int64)])
+        self.seller = np.concatenate([self.seller, np.zeros(extra, dtype=np.int64)])
+        self.category = np.concatenate([self.category, np.zeros(extra, dtype=np.int32)])
+        self.price = np.concatenate([self.price, np.full(extra, np.nan)])
+        self.price_high = np.concatenate([self.price_high, np.full(extra, np.nan)])
+        self.rating = np.concatenate([self.rating, np.zeros(extra)])
+        self.rating_count = np.concatenate([self.rating_count, np.zeros(extra, dtype=np.int64)])
+        self.alive = np.concatenate([self.alive, np.zeros(extra, dtype=bool)])
+
+    def _put(self, product):
+        slot = self.slots.get(product.id)
+        if slot is None:
+            if self.size == len(self.ids):
+                self._grow()
+            slot = self.size
+            self.size += 1
+            self.slots[product.id] = slot
+            self.rows.append(None)
+        code = self.category_codes.setdefault(product.category, len(self.category_codes))
+        self.ids[slot] = product.id
+        self.created[slot] = to_micros(product.createdAt)
+        self.seller[slot] = product.uploader_id
+        self.category[slot] = code
+        self.price[slot] = np.nan if product.sortPrice is None else product.sortPrice
+        self.price_high[slot] = np.nan if product.sortPriceHigh is None else product.sortPriceHigh
+        self.rating_count[slot] = product.rating_count or 0
+        self.rating[slot] = product.rating_sum / product.rating_count if product.rating_count else 0.0
+        self.alive[slot] = True
+        self.rows[slot] = product.to_dict()
+
+    def _remove(self, product_id):
+        slot = self.slots.pop(product_id, None)
+        if slot is not None:
+            self.alive[slot] = False
+            self.rows[slot] = None
+            self.dead += 1
+
+    def _needs_compaction(self):
+        return self.dead > max(1024, self.size // 4)
+
+    def _sort_keys(self, slots, sort_by):
+        """np.lexsort keys (primary key last) reproducing the SQL orderings"""
+        ids = self.ids[slots]
+        if sort_by == 'price-low':  # NULL prices first, as in SQL ASC
+            return [ids, np.nan_to_num(self.price[slots], nan=-np.inf)]
+        if sort_by == 'price-high':  # NULL prices last, as in SQL DESC
+            return [-ids, -np.nan_to_num(self.price_high[slots], nan=-np.inf)]
+        if sort_by == 'rating':
+            return [-ids, -self.rating_count[slots], -self.rating[slots]]
+        return [-ids, -self.created[slots]]  # newest
+
+    def query(self, category=None, seller_id=None, min_price=None, max_price=None,
+              sort_by='newest', position=None, offset=0, limit=None):
+        """Filter, sort and slice the catalog.
+
+        position is a decoded (createdAt, id) cursor and only applies to the
+        newest ordering. Returns (rows, total, next_position), where total
+        counts every match and next_position is set when more rows follow.
+        """
+        self.sync()
+        with self.lock:
+            n = self.size
+            mask = self.alive[:n].copy()
+            if category is not None:
+                code = self.category_codes.get(category)
+                if code is None:
+                    return [], 0, None
+                mask &= self.category[:n] == code
+            if seller_id is not None:
+                mask &= self.seller[:n] == seller_id
+            if min_price is not None:
+                mask &= self.price[:n] >= min_price  # NaN compares False, like NULL in SQL
+            if max_price is not None:
+                mask &= self.price[:n] <= max_price
+            total = int(np.count_nonzero(mask))  # Matches before the cursor is applied
+            if position is not None:
+                created, ids = self.created[:n], self.ids[:n]
+                cursor_micros = to_micros(position[0])
+                mask &= (created < cursor_micros) | ((created == cursor_micros) & (ids < position[1]))
+
+            slots = np.flatnonzero(mask)
+            remaining = len(slots)
+            wanted = offset + limit if limit is not None else remaining
+            if wanted < remaining:
+                # Top-k: keep only rows whose primary key could reach the first
+                # `wanted` places (ties included) before the full sort
+                primary = self._sort_keys(slots, sort_by)[-1]
+                cutoff = np.partition(primary, wanted - 1)[wanted - 1]
+                slots = slots[primary <= cutoff]
+            chosen = slots[np.lexsort(self._sort_keys(slots, sort_by))][offset:wanted]
+
+            rows = [self.rows[slot] for slot in chosen]
+            next_position = None
+            if wanted < remaining and len(chosen):
+                last = chosen[-1]
+                next_position = (from_micros(self.created[last]), int(self.ids[last]))
+            return rows, total, next_position
+
+    def facets(self, category=None, min_price=None, max_price=None, edges=()):
+        """Facet counts matching search_facets(): ({category: count}, [count per price bucket])"""
+        self.sync()
+        with self.lock:
+            n = self.size
+            alive, codes, price = self.alive[:n], self.category[:n], self.price[:n]
+            in_range = alive.copy()
+            if min_price is not None:
+                in_range &= price >= min_price
+            if max_price is not None:
+                in_range &= price <= max_price
+            names = {code: name for name, code in self.category_codes.items()}
+            counts = np.bincount(codes[in_range], minlength=len(names))
+            categories = {names[code]: int(count) for code, count in enumerate(counts)
+                          if count and names[code] is not None}
+
+            priced = alive & ~np.isnan(price)
+            if category is not None:
+                priced &= codes == self.category_codes.get(category, -1)
+            buckets = np.clip(np.searchsorted(edges, price[priced], side='right') - 1, 0, None)
+            histogram = np.bincount(buckets, minlength=len(edges)).tolist()
+            return categories, histogram
+
+
+catalog_engine = CatalogEngine(app.config['CATALOG_REFRESH_INTERVAL']) if np is not None else None
+catalog_state = {'writes': 0}
+
+if app.config['CATALOG_ENGINE'] and catalog_engine is None:
+    print("WARNING: SHOP_CATALOG_ENGINE=1 but NumPy is not installed; listings are served from SQL")
+
+
+def catalog_engine_active():
+    """Serve from the engine only once it has loaded; SQL answers while it builds"""
+    return app.config['CATALOG_ENGINE'] and catalog_engine is not None and catalog_engine.ready()
+
+
+def prune_catalog_changes():
+    """Trim the change log to its most recent CATALOG_CHANGES_KEPT entries"""
+    latest = db.session.query(db.func.max(CatalogChange.id)).scalar() or 0
+    CatalogChange.query.filter(CatalogChange.id <= latest - CATALOG_CHANGES_KEPT).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def catalog_version():
+    """Current catalog version and when it changed (UTC), or (0, None) before any product write"""
+    latest = db.session.query(CatalogChange.id, CatalogChange.changedAt).order_by(CatalogChange.id.desc()).first()
+    if latest is None:
+        return 0, None
+    return latest.id, latest.changedAt.replace(tzinfo=timezone.utc) if latest.changedAt else None
+
+
+def catalog_changed(product_id, seller_id):
+    """Call after committing a product write so in-process caches and read models catch up"""
+    response_cache.invalidate('catalog', f'product:{product_id}', f'seller:{seller_id}')
+    response_cache.catalog_written()
+    if catalog_engine is not None:
+        catalog_engine.invalidate()
+    suggest_index.invalidate()
+    catalog_state['writes'] += 1
+    if catalog_state['writes'] % CATALOG_PRUNE_EVERY == 0:
+        prune_catalog_changes()
+
+
+def migrate_catalog_change_log(conn, bind_key):
+    """Create the catalog_change table and the product triggers that fill it"""
+    db.metadatas[bind_key].create_all(conn)
+    for ddl in CATALOG_CHANGE_DDL:
+        conn.exec_driver_sql(ddl)
+
+
+# ==================== SEARCH SUGGESTIONS ====================
+
+class SuggestIndex(CatalogReadModel):
+    """Sorted prefix index of product names and categories for typeahead.
+
+    `terms` is a sorted list of (term, product_id) holding each product's
+    lowercased full name and every word in it, so a prefix lookup is one
+    bisect plus a scan of the matching run. Products are ranked by rating
+    count, then average rating; when a short prefix matches more than
+    SUGGEST_SCAN_MAX entries, `by_rank` is walked from the top instead until
+    enough products match, which is quick exactly because matches are
+    plentiful. Built in the background on boot and patched per product
+    from the catalog_change log afterwards; answers are memoized per catalog
+    version since typeahead traffic repeats the same short prefixes.
+    """
+
+    def __init__(self, refresh_interval):
+        super().__init__(refresh_interval)
+        self.results = LRUCache(app.config['SUGGEST_CACHE_SIZE'])
+
+    def _reset(self, capacity):
+        self.terms = []
+        self.products = {}  # product id -> (name, category, terms)
+        self.ranks = {}  # product id -> sort key, highest first
+        self.by_rank = []  # Every sort key, ascending
+        self.categories = {}  # category -> product count
+
+    def _rebuild(self, session, version):
+        self._reset(0)
+        columns = (Product.id, Product.name, Product.category, Product.rating_count, Product.rating_sum)
+        for row in session.query(*columns).yield_per(1000):
+            self._add(*row)
+        self.terms.sort()
+        self.by_rank.sort()
+        self.version = version
+
+    @staticmethod
+    def _terms(name):
+        name = (name or '').lower().strip()
+        return {name, *name.split()} - {''}
+
+    def _add(self, product_id, name, category, rating_count, rating_sum, insert=None):
+        terms = self._terms(name)
+        average = rating_sum / rating_count if rating_count else 0.0
+        rank = (rating_count or 0, average, product_id)
+        self.products[product_id] = (name, category, terms)
+        self.ranks[product_id] = rank
+        self.categories[category] = self.categories.get(category, 0) + 1
+        entries = [(term, product_id) for term in terms]
+        if insert:
+            insert(self.by_rank, rank)
+            for entry in entries:
+                insert(self.terms, entry)
+        else:
+            self.by_rank.append(rank)
+            self.terms.extend(entries)
+
+    def _remove(self, product_id):
+        entry = self.products.pop(product_id, None)
+        if entry is None:
+            return
+        rank = self.ranks.pop(product_id)
+        i = bisect.bisect_left(self.by_rank, rank)
+        if i < len(self.by_rank) and self.by_rank[i] == rank:
+            del self.by_rank[i]
+        _, category, terms = entry
+        for term in terms:
+            i = bisect.bisect_left(self.terms, (term, product_id))
+            if i < len(self.terms) and self.terms[i] == (term, product_id):
+                del self.terms[i]
+        self.categories[category] -= 1
+        if not self.categories[category]:
+            del self.categories[category]
+
+    def _put(self, product):
+        self._remove(product.id)
+        self._add(product.id, product.name, product.category, product.rating_count, product.rating_sum,
+                  insert=bisect.insort)
+
+    def _top_ranked(self, prefix, limit):
+        """Best-ranked products with a term starting with prefix, walking by_rank from the top"""
+        ranked = []
+        for rank in reversed(self.by_rank):
+            if any(term.startswith(prefix) for term in self.products[rank[2]][2]):
+                ranked.append(rank)
+                if len(ranked) == limit:
+                    break
+        return ranked
+
+    def suggest(self, prefix, limit):
+        """Top categories and products whose name (or a word in it) starts with prefix"""
+        prefix = prefix.lower().strip()
+        self.sync(wait=True)
+        with self.lock:
+            key = (self.version, prefix, limit)
+            cached = self.results.get(key)
+            if cached is not None:
+                return cached
+            categories = heapq.nlargest(
+                limit, ((count, category) for category, count in self.categories.items()
+                        if category and category.lower().startswith(prefix))
+            )
+            # Every term starting with prefix sorts between (prefix,) and (prefix + max char,)
+            start = bisect.bisect_left(self.terms, (prefix,))
+            end = bisect.bisect_left(self.terms, (prefix + '\U0010ffff',), start)
+            if end - start <= app.config['SUGGEST_SCAN_MAX']:
+                candidates = {product_id for _, product_id in self.terms[start:end]}
+                ranked = heapq.nlargest(limit, map(self.ranks.__getitem__, candidates))
+            else:
+                ranked = self._top_ranked(prefix, limit)
+            products = [(rank[2], *self.products[rank[2]][:2]) for rank in ranked]
+            result = ([(category, count) for count, category in categories], products)
+            self.results.set(key, result)
+        return result
+
+
+suggest_index = SuggestIndex(app.config['CATALOG_REFRESH_INTERVAL'])
+
+
+# ==================== RESPONSE CACHE ====================
+
+class ResponseCache:
+    """LRU/TTL cache of public GET responses, invalidated by entity tags.
+
+    Each entry remembers the generation of every tag it depends on
+    ('catalog', 'product:<id>', 'seller:<id>'); invalidating a tag bumps its
+    generation, so stale entries simply miss. Generations are stamps from one
+    counter, and a tag with no stamp reads as the floor (the counter value at
+    the last prune); pruning raises the floor, which can only turn hits into
+    misses, never make a stale entry look fresh. Writes in other workers are
+    picked up by watching the catalog_change version, which flushes this
+    worker's cache at most one refresh interval later; user writes elsewhere
+    move the user_cache_stamp, which invalidates the 'users' tag that seller
+    listings (they embed the seller profile) carry. Callers that already
+    read the version (catalog_conditional, for its ETag) pass it in; entries
+    are then served only if they were built at exactly that version.
+    """
+
+    def __init__(self, max_size, ttl, refresh_interval, max_tags):
+        self.entries = LRUCache(max_size, ttl)
+        self.generations = {}
+        self.max_tags = max_tags
+        self.clock = 0
+        self.floor = 0
+        self.lock = threading.Lock()
+        self.refresh_interval = refresh_interval
+        self.catalog_version = None
+        self.user_stamp = None
+        self.checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def request_key():
+        """Route plus a normalized (sorted) query string"""
+        args = sorted(request.args.items(multi=True))
+        return request.path + '?' + '&'.join(f'{name}={value}' for name, value in args)
+
+    def _current_version(self):
+        return catalog_version()[0]
+
+    def _sync(self):
+        now = time.monotonic()
+        if now - self.checked_at < self.refresh_interval:
+            return
+        self.checked_at = now
+        latest = self._current_version()
+        if self.catalog_version is not None and latest != self.catalog_version:
+            self.flush()  # Another worker changed products
+        self.catalog_version = latest
+        self._sync_users()
+
+    def _sync_users(self):
+        stamp = user_cache_stamp()
+        if stamp != self.user_stamp:
+            self.invalidate('users')  # Some worker changed a user; seller profiles may be stale
+            self.user_stamp = stamp
+
+    def flush(self):
+        """Drop every entry, and with them the tag generations they were checked against"""
+        self.entries.clear()
+        with self.lock:
+            self.floor = self.clock
+            self.generations.clear()
+
+    def _generation(self, tag):
+        return self.generations.get(tag, self.floor)
+
+    def catalog_written(self):
+        """Adopt the version produced by this worker's own write so it does not flush everything"""
+        self.catalog_version = self._current_version()
+        self._sync_users()  # The interval restarts, so do not postpone the user check with it
+        self.checked_at = time.monotonic()
+
+    def get(self, key, version=None):
+        self._sync()
+        if version is not None and self.catalog_version is not None and version > self.catalog_version:
+            self.flush()  # Another worker changed products since the last check
+            self.catalog_version = version
+        entry = self.entries.get(key)
+        if entry is not None:
+            built_at, tags, response_data = entry
+            if (version is None or built_at == version) and \
+                    all(self._generation(tag) == generation for tag, generation in tags):
+                self.hits += 1
+                return response_data
+        self.misses += 1
+        return None
+
+    def tag_generations(self, tags):
+        """Snapshot of the tags' generations; take it before reading the data to be cached"""
+        return [(tag, self._generation(tag)) for tag in tags]
+
+    def set(self, key, generations, response_data, version=None):
+        """Store response_data under the generations (and version) read before it was built.
+
+        An invalidate() that lands while the handler runs has already moved
+        a generation past the snapshot, so the entry is born stale.
+        """
+        self.entries.set(key, (version, generations, response_data))
+
+    def invalidate(self, *tags):
+        with self.lock:
+            for tag in tags:
+                self.clock += 1
+                self.generations[tag] = self.clock
+            if len(self.generations) > self.max_tags:
+                self.floor = self.clock
+                self.generations.clear()
+        self.invalidations += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'max_size': self.entries.max_size,
+            'ttl': self.entries.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            'invalidations': self.invalidations,
+            'tags': len(self.generations)
+        }
+
+
+response_cache = ResponseCache(
+    app.config['RESPONSE_CACHE_SIZE'], app.config['RESPONSE_CACHE_TTL'], app.config['CATALOG_REFRESH_INTERVAL'],
+    app.config['RESPONSE_CACHE_TAGS']
+)
+
+
+def cached_response(*tag_templates):
+    """Cache a public GET endpoint's successful responses.
+
+    Tag templates are formatted with the view arguments, e.g.
+    @cached_response('product:{product_id}'). Under catalog_conditional the
+    entries are pinned to the catalog version its ETag was made from. Each
+    entry also keeps the gzip/br bodies compress_response makes for it, so
+    a hit is not compressed again.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(*args, **kwargs):
+            if wants_stream():
+                return handler(*args, **kwargs)  # Streams are never buffered, so never cached
+
+            key = response_cache.request_key()
+            version = g.get('catalog_version')
+            cached = response_cache.get(key, version)
+            if cached is not None:
+                body, mimetype, encoded = cached
+                g.encoded_bodies = (body, encoded)
+                response = make_response(body, 200)
+                response.mimetype = mimetype
+                response.headers['X-Cache'] = 'HIT'
+                return response
+
+            tags = [template.format(**kwargs) for template in tag_templates]
+            generations = response_cache.tag_generations(tags)
+            response = make_response(handler(*args, **kwargs))
+            if response.status_code == 200 and not response.is_streamed:
+                body, encoded = response.get_data(), {}
+                g.encoded_bodies = (body, encoded)  # compress_response fills in the variant it makes
+                response_cache.set(key, generations, (body, response.mimetype, encoded), version)
+            response.headers['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
+
+
+# ==================== CONDITIONAL GET ====================
+
+COMPRESSED_ETAG_SUFFIXES = ('gzip', 'br')  # Appended to ETags of compressed variants
+
+
+def matching_etag(etag):
+    """Return the variant of etag the client's If-None-Match holds, if any"""
+    for candidate in (etag,) + tuple(f'{etag}-{suffix}' for suffix in COMPRESSED_ETAG_SUFFIXES):
+        if request.if_none_match.contains(candidate):
+            return candidate
+    return None
+
+
+def not_modified(etag, last_modified=None):
+    response = make_response('', 304)
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept-Encoding')
+    response.vary.add('Accept')
+    return response
+
+
+def catalog_conditional(handler):
+    """Validate a catalog read against the catalog version before doing any work.
+
+    The ETag is derived from the catalog_change version, which moves on
+    every product (and therefore rating) write, so a matching If-None-Match
+    is answered with 304 without running the handler. changedAt only has
+    one-second resolution, so If-Modified-Since gets a 304 only when the last
+    change is strictly older than the second it names; a write in that same
+    second might not be in the client's copy.
+    NDJSON streams get their own ETag since they are a different representation.
+    """
+    @wraps(handler)
+    def wrapper(*args, **kwargs):
+        version, changed_at = catalog_version()
+        g.catalog_version = version  # cached_response serves only bodies built at this version
+        etag = f'catalog-{version}-ndjson' if wants_stream() else f'catalog-{version}'
+
+        if request.if_none_match:
+            matched = matching_etag(etag)
+            if matched:
+                return not_modified(matched, changed_at)
+        elif changed_at and request.if_modified_since and changed_at.replace(microsecond=0) < request.if_modified_since:
+            return not_modified(etag, changed_at)
+
+        response = make_response(handler(*args, **kwargs))
+        if response.status_code == 200:
+            response.set_etag(etag)
+            if changed_at:
+                response.last_modified = changed_at
+            response.headers['Cache-Control'] = 'no-cache'
+            response.vary.add('Accept')
+        return response
+    return wrapper
+
+
+def content_conditional(handler):
+    """Tag a response with a content-hash ETag and answer a matching If-None-Match with 304"""
+    @wraps(handler)
+    def wrapper(*args, **kwargs):
+        response = make_response(handler(*args, **kwargs))
+        if response.status_code == 200 and not response.is_streamed:
+            response.add_etag()
+            etag, _ = response.get_etag()
+            matched = matching_etag(etag)
+            if matched:
+                return not_modified(matched)
+            response.headers['Cache-Control'] = 'no-cache'
+        return response
+    return wrapper
+
+
+# ==================== PASSWORD HASHING ====================
+
+class PasswordHashBusy(Exception):
+    """Raised instead of hashing when every hashing slot on this host is taken"""
+
+
+def normalized_hash_method(method):
+    """Spell out the defaults werkzeug fills in, e.g. 'scrypt' -> 'scrypt:32768:8:1'"""
+    parts = method.split(':')
+    if parts[0] == 'scrypt':
+        defaults = ['scrypt', '32768', '8', '1']
+    elif parts[0] == 'pbkdf2':
+        defaults = ['pbkdf2', 'sha256', str(DEFAULT_PBKDF2_ITERATIONS)]
+    else:
+        return method
+    return ':'.join(parts + defaults[len(parts):])
+
+
+class HashSlots:
+    """Host-wide limit on concurrent password hashes, shared by every worker process.
+
+    Slot i is an exclusive flock on file i in `directory`. Taking one never
+    blocks, and the kernel frees it if the holder dies mid-hash, so a killed
+    worker cannot leak capacity. Without fcntl (Windows) the limit falls
+    back to a per-process semaphore.
+    """
+
+    def __init__(self, count, directory):
+        self.count = count
+        self.directory = directory
+        self.shared = fcntl is not None
+        self.local = threading.BoundedSemaphore(count)
+        self.next = 0
+        if self.shared:
+            os.makedirs(directory, exist_ok=True)
+
+    def acquire(self):
+        """A held slot to pass to release(), or None when all are taken"""
+        if not self.shared:
+            return True if self.local.acquire(blocking=False) else None
+        first = self.next
+        self.next = (first + 1) % self.count  # Start elsewhere next time to spread the probes
+        for i in range(self.count):
+            fd = os.open(os.path.join(self.directory, f'slot-{(first + i) % self.count}'), os.O_RDWR | os.O_CREAT)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                os.close(fd)
+        return None
+
+    def release(self, slot):
+        if not self.shared:
+            self.local.release()
+            return
+        fcntl.flock(slot, fcntl.LOCK_UN)
+        os.close(slot)
+
+
+class PasswordHasher:
+    """Bounds password hashing host-wide so a login burst gets fast 503s.
+
+    Each hash or verify takes one of PASSWORD_HASH_CONCURRENCY slots shared
+    by every gunicorn worker on the host (see HashSlots); when none is free
+    it raises PasswordHashBusy at once instead of tying up another worker
+    for a hash the CPU cannot fit. The hash runs on the request thread by
+    default. PASSWORD_HASH_WORKERS > 0 moves it to a per-worker process
+    pool, which only pays off with threaded workers (gunicorn --threads)
+    where the GIL would otherwise be held between hashing steps.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pool = None
+        self.pool_pid = None
+        self.slots = None
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.busy_seconds = 0.0
+
+    def _slots(self):
+        with self.lock:
+            if self.slots is None:
+                self.slots = HashSlots(app.config['PASSWORD_HASH_CONCURRENCY'], app.config['PASSWORD_HASH_SLOT_DIR'])
+            return self.slots
+
+    def _executor(self):
+        with self.lock:
+            if self.pool is None or self.pool_pid != os.getpid():
+                self.pool = ProcessPoolExecutor(max_workers=app.config['PASSWORD_HASH_WORKERS'])
+                self.pool_pid = os.getpid()
+            return self.pool
+
+    def _run(self, func, *args):
+        slots = self._slots()
+        slot = slots.acquire()
+        if slot is None:
+            with self.lock:
+                self.rejected += 1
+            raise PasswordHashBusy()
+        with self.lock:
+            self.in_flight += 1
+        started = time.perf_counter()
+        try:
+            if app.config['PASSWORD_HASH_WORKERS'] <= 0:
+                result = func(*args)
+            else:
+                result = self._executor().submit(func, *args).result()
+        except BrokenProcessPool:
+            with self.lock:
+                self.pool = None  # A hashing process died; start a fresh pool next time
+            raise
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+            slots.release(slot)
+        with self.lock:
+            self.completed += 1
+            self.busy_seconds += time.perf_counter() - started
+        return result
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, app.config['PASSWORD_HASH_METHOD'])
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True when password_hash was made with other parameters than PASSWORD_HASH_METHOD"""
+        return password_hash.split('$', 1)[0] != normalized_hash_method(app.config['PASSWORD_HASH_METHOD'])
+
+    def stats(self):
+        return {
+            'method': normalized_hash_method(app.config['PASSWORD_HASH_METHOD']),
+            'workers': app.config['PASSWORD_HASH_WORKERS'],
+            'concurrency': app.config['PASSWORD_HASH_CONCURRENCY'],
+            'shared_slots': fcntl is not None,
+            'in_flight': self.in_flight,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'avg_ms': round(self.busy_seconds / self.completed * 1000, 1) if self.completed else None
+        }
+
+
+password_hasher = PasswordHasher()
+
+
+def hashing_busy():
+    """503 for a request turned away because every hashing slot was taken"""
+    response = jsonify({'success': False, 'error': 'Server busy, please try again shortly'})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(app.config['PASSWORD_HASH_RETRY_AFTER'])
+    return response
+
+
+# ==================== AUTH TOKENS ====================
+
+# What a verified token says about its bearer; stands in for the User row
+# on endpoints that only need to know who is calling
+AuthIdentity = namedtuple('AuthIdentity', 'id username role status')
+
+token_serializers = {}  # SECRET_KEY -> serializer
+
+
+def token_serializer():
+    key = app.config['SECRET_KEY']
+    if key not in token_serializers:
+        token_serializers[key] = URLSafeTimedSerializer(key, salt='auth-token')
+    return token_serializers[key]
+
+
+def tokens_enabled():
+    """Tokens are only as secret as the key: the committed default is accepted in debug mode only"""
+    return app.debug or app.config['SECRET_KEY'] != DEFAULT_SECRET_KEY
+
+
+if app.config['SECRET_KEY'] == DEFAULT_SECRET_KEY:
+    print("WARNING: SHOP_SECRET_KEY is not set; login tokens are disabled outside debug mode")
+
+
+class TokenRevocations:
+    """Per-user token versions from auth_revocation, mirrored in memory.
+
+    Only users whose tokens were ever revoked have a row, so the whole table
+    is reloaded at most once per refresh interval; verifying a token is then
+    a dict lookup. Revocations made in this worker apply immediately, those
+    from other workers within the refresh interval.
+    """
+
+    def __init__(self, refresh_interval):
+        self.refresh_interval = refresh_interval
+        self.versions = {}
+        self.loaded_at = None
+        self.lock = threading.Lock()
+
+    def current(self, user_id):
+        if self.loaded_at is None or time.monotonic() - self.loaded_at >= self.refresh_interval:
+            with self.lock, Session(db.engines['auth_db']) as session:
+                self.versions = dict(session.query(AuthRevocation.userId, AuthRevocation.version))
+                self.loaded_at = time.monotonic()
+        return self.versions.get(user_id, 0)
+
+    def fresh(self, user_id):
+        """Current version straight from the database, for issuing tokens"""
+        row = db.session.get(AuthRevocation, user_id)
+        version = row.version if row else 0
+        self.versions[user_id] = version
+        return version
+
+    def revoke(self, user_id):
+        """Invalidate every token issued to user_id so far"""
+        try:
+            updated = AuthRevocation.query.filter_by(userId=user_id).update(
+                {'version': AuthRevocation.version + 1, 'updatedAt': datetime.utcnow()}
+            )
+            if not updated:
+                db.session.add(AuthRevocation(userId=user_id, version=1))
+            db.session.commit()
+        except IntegrityError:  # Another worker inserted the row first
+            db.session.rollback()
+            return self.revoke(user_id)
+        self.fresh(user_id)
+
+
+token_revocations = TokenRevocations(app.config['AUTH_REVOCATION_REFRESH'])
+
+
+class AuthError(Exception):
+    pass
+
+
+def issue_token(user):
+    """Signed, expiring bearer token for an active user, or None while tokens are disabled"""
+    if not tokens_enabled():
+        return None
+    return token_serializer().dumps({
+        'uid': user.id, 'name': user.username, 'role': user.role,
+        'status': user.status, 'ver': token_revocations.fresh(user.id)
+    })
+
+
+def verify_token(token):
+    """AuthIdentity for a valid token; raises AuthError if it is bad, expired or revoked"""
+    if not tokens_enabled():
+        raise AuthError('Token auth is disabled: SHOP_SECRET_KEY is not set')
+    try:
+        claims = token_serializer().loads(token, max_age=app.config['AUTH_TOKEN_TTL'])
+    except SignatureExpired:
+        raise AuthError('Token expired')
+    except BadSignature:
+        raise AuthError('Invalid token')
+    if claims['ver'] < token_revocations.current(claims['uid']):
+        raise AuthError('Token revoked')
+    return AuthIdentity(claims['uid'], claims['name'], claims['role'], claims['status'])
+
+
+def token_auth(handler):
+    """Verify an `Authorization: Bearer` token, if one is sent, before the handler runs.
+
+    A valid token becomes g.auth and acting_user() returns it without
+    touching the database; a bad, expired or revoked one is a 401. Requests
+    without a token fall back to the legacy admin_id/user_id parameters.
+    """
+    @wraps(handler)
+    def wrapper(*args, **kwargs):
+        g.auth = None
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() == 'bearer' and token:
+            try:
+                g.auth = verify_token(token.strip())
+            except AuthError as e:
+                return jsonify({'success': False, 'error': str(e)}), 401
+        return handler(*args, **kwargs)
+    return wrapper
+
+
+def acting_user(legacy_id, load=False):
+    """The caller: the token's identity, else the user named by a legacy id parameter.
+
+    Legacy lookups come from the user cache. load=True always returns the
+    full UserSnapshot, for endpoints that need more than the id, username,
+    role and status a token carries.
+    """
+    if g.get('auth') is not None:
+        return user_cache.get(g.auth.id) if load else g.auth
+    return user_cache.get(legacy_id)
+
+
+def token_claims_changed(user):
+    """True when pending changes to user alter what its tokens assert, or its password"""
+    state = db.inspect(user)
+    return any(state.attrs[name].history.has_changes() for name in ('username', 'role', 'status', 'password_hash'))
+
+
+# ==================== USER CACHE ====================
+
+class UserSnapshot(namedtuple('UserSnapshot', [
+        'id', 'username', 'email', 'full_name', 'phone', 'role', 'shop_name',
+        'shop_description', 'status', 'canUploadStock', 'created_at'])):
+    """Immutable copy of a User row (minus the password hash), safe to share across requests"""
+    __slots__ = ()
+
+    @classmethod
+    def of(cls, user):
+        return cls(*(getattr(user, name) for name in cls._fields))
+
+    to_dict = User.to_dict  # Only reads columns, so it works on a snapshot too
+
+
+class UserCache:
+    """Per-worker LRU/TTL cache of UserSnapshots keyed by user id.
+
+    Endpoints that change a user call invalidate(), which drops the entry
+    here and bumps the single-row user_cache_stamp; every worker compares
+    that stamp at most once per refresh interval and flushes when it moved.
+    Code that modifies a user must load the User row itself, never a snapshot.
+    """
+
+    def __init__(self, max_size, ttl, refresh_interval):
+        self.entries = LRUCache(max_size, ttl)
+        self.refresh_interval = refresh_interval
+        self.stamp = None
+        self.checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def _check_stamp(self):
+        now = time.monotonic()
+        if now - self.checked_at < self.refresh_interval:
+            return
+        stamp = user_cache_stamp()
+        if stamp != self.stamp:
+            self.entries.clear()
+            self.stamp = stamp
+        self.checked_at = now
+
+    def get(self, user_id):
+        """Snapshot of user_id, or None when it is missing or not an id"""
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return None
+        self._check_stamp()
+        snapshot = self.entries.get(user_id)
+        if snapshot is not None:
+            self.hits += 1
+            return snapshot
+        self.misses += 1
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        snapshot = UserSnapshot.of(user)
+        self.entries.set(user_id, snapshot)
+        return snapshot
+
+    def invalidate(self, user_id):
+        """Call after committing a write to user_id"""
+        self.entries.pop(int(user_id))
+        response_cache.invalidate(f'seller:{user_id}')  # Seller listings embed the profile
+        if not UserCacheStamp.query.update({'version': UserCacheStamp.version + 1}):
+            db.session.add(UserCacheStamp(id=1, version=1))
+        db.session.commit()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'max_size': self.entries.max_size,
+            'ttl': self.entries.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else None
+        }
+
+
+user_cache = UserCache(app.config['USER_CACHE_SIZE'], app.config['USER_CACHE_TTL'], app.config['USER_CACHE_REFRESH'])
+
+
+# ==================== AUTH THROTTLING ====================
+
+class WindowCounters:
+    """Per-worker attempt counters: key -> [bucket, count, previous], LRU-evicted"""
+
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def add(self, key, bucket):
+        """Count one attempt for key in window `bucket`; returns (count, previous)"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = self.entries[key] = [bucket, 0, 0]
+                if len(self.entries) > self.max_keys:
+                    self.entries.popitem(last=False)
+            else:
+                self.entries.move_to_end(key)
+                if entry[0] != bucket:
+                    entry[2] = entry[1] if entry[0] == bucket - 1 else 0
+                    entry[0], entry[1] = bucket, 0
+            entry[1] += 1
+            return entry[1], entry[2]
+
+    def peek(self, key, bucket):
+        """(count, previous) for key in window `bucket`, without counting anything"""
+        with self.lock:
+            entry = self.entries.get(key)
+        return window_counts(entry, bucket)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def window_counts(entry, bucket):
+    """Roll a stored (bucket, count, previous) forward to window `bucket`"""
+    if entry is None:
+        return 0, 0
+    stored_bucket, count, previous = entry
+    if stored_bucket == bucket:
+        return count, previous
+    return 0, count if stored_bucket == bucket - 1 else 0
+
+
+class SharedWindowCounters:
+    """The same counters as rows of auth_throttle_counter, shared by all workers.
+
+    Each attempt is one upsert; rows from finished windows are swept once
+    per window.
+    """
+
+    UPSERT = (
+        "INSERT INTO auth_throttle_counter (key, bucket, count, previous) VALUES (?, ?, 1, 0) "
+        "ON CONFLICT(key) DO UPDATE SET "
+        "previous = CASE WHEN bucket = excluded.bucket THEN previous "
+        "WHEN bucket = excluded.bucket - 1 THEN count ELSE 0 END, "
+        "count = CASE WHEN bucket = excluded.bucket THEN count + 1 ELSE 1 END, "
+        "bucket = excluded.bucket "
+        "RETURNING count, previous"
+    )
+
+    def __init__(self):
+        self.swept_bucket = None
+
+    def add(self, key, bucket):
+        with db.engines['auth_db'].begin() as conn:
+            if self.swept_bucket != bucket:
+                conn.exec_driver_sql("DELETE FROM auth_throttle_counter WHERE bucket < ?", (bucket - 1,))
+                self.swept_bucket = bucket
+            count, previous = conn.exec_driver_sql(self.UPSERT, (key, bucket)).one()
+        return count, previous
+
+    def peek(self, key, bucket):
+        with db.engines['auth_db'].connect() as conn:
+            entry = conn.exec_driver_sql(
+                "SELECT bucket, count, previous FROM auth_throttle_counter WHERE key = ?", (key,)
+            ).first()
+        return window_counts(entry, bucket)
+
+    def __len__(self):
+        with Session(db.engines['auth_db']) as session:
+            return session.query(AuthThrottleCounter).count()
+
+
+class AuthThrottle:
+    """Sliding-window limit on login and signup attempts per client IP and per username.
+
+    Uses the two-bucket approximation: the estimate is this window's count
+    plus last window's count weighted by how much of it still overlaps the
+    sliding window. That keeps two integers per key, so each decision is a
+    constant-time counter update.
+    """
+
+    def __init__(self, window, counters):
+        self.window = window
+        self.counters = counters
+        self.allowed = 0
+        self.rejected = 0
+
+    def _window(self, now):
+        position = (time.time() if now is None else now) / self.window
+        bucket = int(position)
+        return bucket, position - bucket  # Window, and the fraction of it that has passed
+
+    def hit(self, key, limit, now=None):
+        """Count an attempt for key; returns 0 if it is allowed, else seconds until it would be"""
+        bucket, elapsed = self._window(now)
+        count, previous = self.counters.add(key, bucket)
+        return self._decide(count, previous, elapsed, limit)
+
+    def check(self, key, limit, now=None):
+        """Like hit(), but the attempt is only counted if the caller record()s it afterwards"""
+        bucket, elapsed = self._window(now)
+        count, previous = self.counters.peek(key, bucket)
+        return self._decide(count + 1, previous, elapsed, limit)
+
+    def record(self, key, now=None):
+        self.counters.add(key, self._window(now)[0])
+
+    def _decide(self, count, previous, elapsed, limit):
+        if count + previous * (1 - elapsed) <= limit:
+            self.allowed += 1
+            return 0
+        self.rejected += 1
+        if count > limit:
+            # Wait out this window, then for this window's count to fade below the limit
+            wait = (1 - elapsed) + (1 - limit / count)
+        else:
+            # Wait for last window's share to fade enough
+            wait = (1 - (limit - count) / previous) - elapsed
+        return max(1, math.ceil(wait * self.window))
+
+    def stats(self):
+        return {
+            'shared': isinstance(self.counters, SharedWindowCounters),
+            'window': self.window,
+            'keys': len(self.counters),
+            'allowed': self.allowed,
+            'rejected': self.rejected
+        }
+
+
+auth_throttle = AuthThrottle(
+    app.config['AUTH_THROTTLE_WINDOW'],
+    SharedWindowCounters() if app.config['AUTH_THROTTLE_SHARED'] else WindowCounters(app.config['AUTH_THROTTLE_MAX_KEYS'])
+)
+
+
+def throttled(handler):
+    """Reject a login or signup attempt with 429 once its IP or username is over the limit.
+
+    Runs before the handler, so a rejected attempt costs no password hash
+    and no user lookup. Every attempt counts toward the IP, including
+    rejected ones. A username only counts attempts that reached the handler
+    and failed, so flooding someone else's username cannot keep them locked
+    out past one window. The client IP is request.remote_addr, so set
+    TRUSTED_PROXY_HOPS when the app runs behind a load balancer.
+    """
+    @wraps(handler)
+    def wrapper(*args, **kwargs):
+        if request.method == 'OPTIONS':
+            return handler(*args, **kwargs)
+        retry_after = auth_throttle.hit(f'ip:{request.remote_addr}', app.config['AUTH_THROTTLE_IP_LIMIT'])
+        user_key = None
+        if not retry_after:
+            username = (request.get_json(silent=True) or {}).get('username')
+            if isinstance(username, str) and username:
+                user_key = f'user:{username.lower()}'
+                retry_after = auth_throttle.check(user_key, app.config['AUTH_THROTTLE_USER_LIMIT'])
+        if retry_after:
+            response = jsonify({'success': False, 'error': 'Too many attempts, please try again later'})
+            response.status_code = 429
+            response.headers['Retry-After'] = str(retry_after)
+            return response
+        response = make_response(handler(*args, **kwargs))
+        if user_key and 400 <= response.status_code < 500:
+            auth_throttle.record(user_key)  # Wrong password, inactive account, taken username...
+        return response
+    return wrapper
+
+
+# ==================== SCHEMA MIGRATIONS ====================
+
+# Each bind records its applied schema version in SQLite's PRAGMA user_version.
+# Steps run in order inside one BEGIN IMMEDIATE transaction per bind and must
+# be idempotent, because a fresh database already gets the latest tables from
+# step 1. Append new steps to the end of a bind's list; never renumber.
+
+def migrate_create_tables(conn, bind_key):
+    """Create any missing tables for the bind from the models"""
+    db.metadatas[bind_key].create_all(conn)
+
+
+def migrate_create_indexes(conn, bind_key):
+    """Create every index declared on the bind's models that does not exist yet"""
+    for model_table in db.metadatas[bind_key].sorted_tables:
+        for index in model_table.indexes:
+            index.create(conn, checkfirst=True)
+
+
+def migrate_product_sort_price(conn, bind_key):
+    """Add Product.sortPrice to an existing products.db and backfill it"""
+    columns = [row[1] for row in conn.exec_driver_sql("PRAGMA table_info(product)")]
+    if 'sortPrice' not in columns:
+        conn.exec_driver_sql("ALTER TABLE product ADD COLUMN sortPrice FLOAT")
+    conn.exec_driver_sql(
+        "UPDATE product SET sortPrice = CASE WHEN priceType = 'range' "
+        "THEN COALESCE(priceMin, price) ELSE COALESCE(price, priceMin) END "
+        "WHERE sortPrice IS NULL"
+    )
+
+
+def migrate_product_sort_price_high(conn, bind_key):
+    """Add Product.sortPriceHigh (and its index) to an existing products.db and backfill it"""
+    columns = [row[1] for row in conn.exec_driver_sql("PRAGMA table_info(product)")]
+    if 'sortPriceHigh' not in columns:
+        conn.exec_driver_sql("ALTER TABLE product ADD COLUMN sortPriceHigh FLOAT")
+    conn.exec_driver_sql(
+        "UPDATE product SET sortPriceHigh = CASE WHEN priceType = 'range' "
+        "THEN COALESCE(priceMax, price) ELSE COALESCE(price, priceMax) END "
+        "WHERE sortPriceHigh IS NULL"
+    )
+    migrate_create_indexes(conn, bind_key)
+
+
+def migrate_idempotency_claimed_at(conn, bind_key):
+    """Add IdempotencyKey.claimedAt; rows claimed before it existed count as expired leases"""
+    columns = [row[1] for row in conn.exec_driver_sql("PRAGMA table_info(idempotency_key)")]
+    if 'claimedAt' not in columns:
+        conn.exec_driver_sql("ALTER TABLE idempotency_key ADD COLUMN claimedAt DATETIME")
+
+
+def migrate_product_search_index(conn, bind_key):
+    """Create the product FTS5 index and its sync triggers, populating it on first run"""
+    exists = conn.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='product_fts'"
+    ).first()
+    try:
+        for ddl in PRODUCT_FTS_DDL:
+            conn.exec_driver_sql(ddl)
+        if not exists:
+            conn.exec_driver_sql("INSERT INTO product_fts(product_fts) VALUES ('rebuild')")
+        fts_state['available'] = True
+    except OperationalError as e:
+        # SQLite built without FTS5: /api/search keeps using LIKE
+        print(f"FTS5 unavailable, search falls back to LIKE: {str(e)}")
+        fts_state['available'] = False
+
+
+RATING_AGGREGATE_COLUMNS = ['rating_count', 'rating_sum'] + [f'rating_{stars}' for stars in range(1, 6)]
+
+
+def rebuild_rating_aggregates(conn):
+    """Recompute every product's rating aggregates from the rating table"""
+    valid = "FROM rating WHERE rating.productId = product.id AND rating.rating BETWEEN 1 AND 5"
+    histogram = ', '.join(
+        f"rating_{stars} = (SELECT COUNT(*) {valid} AND rating.rating = {stars})" for stars in range(1, 6)
+    )
+    conn.exec_driver_sql(
+        f"UPDATE product SET rating_count = (SELECT COUNT(*) {valid}), "
+        f"rating_sum = (SELECT COALESCE(SUM(rating.rating), 0) {valid}), {histogram}"
+    )
+
+
+def migrate_product_rating_aggregates(conn, bind_key):
+    """Add the rating aggregate columns to product and fill them from existing ratings"""
+    columns = [row[1] for row in conn.exec_driver_sql("PRAGMA table_info(product)")]
+    for name in RATING_AGGREGATE_COLUMNS:
+        if name not in columns:
+            conn.exec_driver_sql(f"ALTER TABLE product ADD COLUMN {name} INTEGER NOT NULL DEFAULT 0")
+    rebuild_rating_aggregates(conn)
+
+
+MIGRATIONS = {
+    'auth_db': [
+        (1, 'create tables', migrate_create_tables),
+        (2, 'hot column indexes', migrate_create_indexes),
+        (3, 'auth token revocations', migrate_create_tables),
+        (4, 'user cache stamp', migrate_create_tables),
+        (5, 'auth throttle counters', migrate_create_tables),
+    ],
+    'products_db': [
+        (1, 'create tables', migrate_create_tables),
+        (2, 'product sort price', migrate_product_sort_price),
+        (3, 'product full-text index', migrate_product_search_index),
+        (4, 'hot column indexes', migrate_create_indexes),
+        (5, 'product rating aggregates', migrate_product_rating_aggregates),
+        (6, 'idempotency keys', migrate_create_tables),
+        (7, 'catalog change log', migrate_catalog_change_log),
+        (8, 'idempotency claim lease', migrate_idempotency_claimed_at),
+        (9, 'product high sort price', migrate_product_sort_price_high),
+    ],
+}
+
+
+def schema_version(conn):
+    return conn.exec_driver_sql('PRAGMA user_version').scalar()
+
+
+def run_migrations():
+    """Bring every bind up to its latest schema version.
+
+    When a bind is already current this costs a single PRAGMA read, so it is
+    safe to call on every worker boot. Returns the (bind, version, description)
+    steps that were applied.
+    """
+    applied = []
+    for bind_key, steps in MIGRATIONS.items():
+        engine = db.engines[bind_key]
+        latest = steps[-1][0]
+        with engine.connect() as conn:
+            if schema_version(conn) >= latest:
+                continue
+
+        # Take SQLite's write lock up front so concurrently booting workers
+        # queue here and then find the work already done
+        with engine.connect() as conn:
+            conn = conn.execution_options(isolation_level='AUTOCOMMIT')
+            conn.exec_driver_sql('BEGIN IMMEDIATE')
+            try:
+                current = schema_version(conn)
+                for version, description, step in steps:
+                    if version > current:
+                        step(conn, bind_key)
+                        applied.append((bind_key, version, description))
+                if latest > current:
+                    conn.exec_driver_sql(f'PRAGMA user_version = {latest}')
+                conn.exec_driver_sql('COMMIT')
+            except Exception:
+                conn.exec_driver_sql('ROLLBACK')
+                raise
+    return applied
+
+
+@app.cli.command('migrate')
+def migrate_command():
+    """Apply pending schema migrations to auth.db and products.db"""
+    applied = run_migrations()
+    for bind_key, version, description in applied:
+        print(f"{bind_key}: applied v{version} ({description})")
+    if not applied:
+        print("Schema is up to date")
+
+
+@app.cli.command('rebuild-ratings')
+def rebuild_ratings_command():
+    """Recompute Product rating counts, sums and histograms from the rating table"""
+    with db.engines['products_db'].begin() as conn:
+        rebuild_rating_aggregates(conn)
+    print("Rating aggregates rebuilt")
+
+
 # ==================== AUTHENTICATION ENDPOINTS ====================
 
+def duplicate_user_error(error):
+    """Client-facing message for an IntegrityError raised by a User insert/update"""
+    message = str(error.orig)
+    if 'user.username' in message or '(username)' in message:
+        return 'Username already exists'
+    if 'user.email' in message or '(email)' in message:
+        return 'Email already exists'
+    return None
+
+
 @app.route('/api/auth/signup', methods=['POST', 'OPTIONS'])
+@throttled
 def signup():
     """Register a new user (buyer)"""
     if request.method == 'OPTIONS':
@@ -235,15 +2452,7 @@ def signup():
         if not data.get('username') or not data.get('email') or not data.get('password'):
             return jsonify({'success': False, 'error': 'Username, email, and password required'}), 400
         
-        # Check if username exists
-        if User.query.filter_by(username=data['username']).first():
-            return jsonify({'success': False, 'error': 'Username already exists'}), 400
-        
-        # Check if email exists
-        if User.query.filter_by(email=data['email']).first():
-            return jsonify({'success': False, 'error': 'Email already exists'}), 400
-        
-        # Create new user
+        # Create new user; the unique constraints reject a taken username or email
         user = User(
             username=data['username'],
             email=data['email'],
@@ -262,6 +2471,16 @@ def signup():
             'message': 'User registered successfully',
             'user': user.to_dict()
         }), 201
+    except IntegrityError as ie:
+        db.session.rollback()
+        error = duplicate_user_error(ie)
+        if error is None:
+            print(f"Signup error: {str(ie)}")
+            return jsonify({'success': False, 'error': 'Signup failed: ' + str(ie)}), 500
+        return jsonify({'success': False, 'error': error}), 400
+    except PasswordHashBusy:
+        db.session.rollback()
+        return hashing_busy()
     except Exception as e:
         db.session.rollback()
         print(f"Signup error: {str(e)}")
@@ -269,6 +2488,7 @@ def signup():
 
 
 @app.route('/api/auth/login', methods=['POST', 'OPTIONS'])
+@throttled
 def login():
     """Login user"""
     if request.method == 'OPTIONS':
@@ -291,30 +2511,45 @@ def login():
         if user.status != 'active':
             return jsonify({'success': False, 'error': 'User account is inactive'}), 403
         
+        if password_hasher.needs_rehash(user.password_hash):
+            # Upgrade to the current hash parameters while we have the plain password
+            try:
+                user.set_password(data['password'])
+                db.session.commit()
+            except PasswordHashBusy:
+                db.session.rollback()  # Not worth failing the login over; retried next time
+        
+        token = issue_token(user)  # None without SHOP_SECRET_KEY; clients fall back to user_id
         return jsonify({
             'success': True,
             'message': 'Login successful',
-            'user': user.to_dict()
+            'user': user.to_dict(),
+            'token': token,
+            'token_expires_in': app.config['AUTH_TOKEN_TTL'] if token else None
         }), 200
+    except PasswordHashBusy:
+        db.session.rollback()
+        return hashing_busy()
     except Exception as e:
         print(f"Login error: {str(e)}")
         return jsonify({'success': False, 'error': 'Login failed: ' + str(e)}), 500
 
 
 @app.route('/api/auth/check', methods=['POST', 'OPTIONS'])
+@token_auth
 def check_auth():
-    """Check if user is authenticated"""
+    """Check if user is authenticated (by bearer token, or the legacy user_id)"""
     if request.method == 'OPTIONS':
         return '', 200
     
     try:
-        data = request.json
-        user_id = data.get('user_id') if data else None
+        data = request.get_json(silent=True)
+        user_id = g.auth.id if g.auth else (data.get('user_id') if data else None)
         
         if not user_id:
             return jsonify({'success': False, 'authenticated': False, 'error': 'User ID required'}), 400
         
-        user = User.query.get(user_id)
+        user = user_cache.get(user_id)
         
         if user and user.status == 'active':
             return jsonify({
@@ -332,10 +2567,11 @@ def check_auth():
 # ==================== SELLER MANAGEMENT (ADMIN ONLY) ====================
 
 @app.route('/api/admin/sellers', methods=['GET'])
+@token_auth
 def get_all_sellers():
     """Get all seller profiles - admin only"""
     admin_id = request.args.get('admin_id')
-    admin = User.query.get(admin_id)
+    admin = acting_user(admin_id)
     
     if not admin or admin.role != 'admin':
         return jsonify({'success': False, 'error': 'Unauthorized'}), 403
@@ -350,7 +2586,7 @@ def get_all_sellers():
 @app.route('/api/admin/sellers/<int:seller_id>', methods=['GET'])
 def get_seller(seller_id):
     """Get specific seller profile"""
-    seller = User.query.get(seller_id)
+    seller = user_cache.get(seller_id)
     if not seller or seller.role != 'seller':
         return jsonify({'success': False, 'error': 'Seller not found'}), 404
     
@@ -361,11 +2597,12 @@ def get_seller(seller_id):
 
 
 @app.route('/api/admin/sellers', methods=['POST'])
+@token_auth
 def create_seller_profile():
     """Create a new seller profile - admin only"""
     data = request.json or {}
     admin_id = data.get('admin_id')
-    admin = User.query.get(admin_id)
+    admin = acting_user(admin_id)
     
     if not admin or admin.role != 'admin':
         return jsonify({'success': False, 'error': 'Unauthorized'}), 403
@@ -375,11 +2612,6 @@ def create_seller_profile():
     if not username or not email:
         return jsonify({'success': False, 'error': 'Username and email required'}), 400
     
-    if User.query.filter_by(username=username).first():
-        return jsonify({'success': False, 'error': 'Username already exists'}), 400
-    if User.query.filter_by(email=email).first():
-        return jsonify({'success': False, 'error': 'Email already exists'}), 400
-    
     try:
         seller = User(
             username=username,
@@ -403,18 +2635,23 @@ def create_seller_profile():
         }), 201
     except IntegrityError as ie:
         db.session.rollback()
-        return jsonify({'success': False, 'error': 'Database integrity error (possible duplicate)'}), 400
+        error = duplicate_user_error(ie) or 'Database integrity error (possible duplicate)'
+        return jsonify({'success': False, 'error': error}), 400
+    except PasswordHashBusy:
+        db.session.rollback()
+        return hashing_busy()
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 400
 
 
 @app.route('/api/admin/sellers/<int:seller_id>', methods=['PUT'])
+@token_auth
 def update_seller_profile(seller_id):
     """Update seller profile - admin only"""
     data = request.json
     admin_id = data.get('admin_id')
-    admin = User.query.get(admin_id)
+    admin = acting_user(admin_id)
     
     if not admin or admin.role != 'admin':
         return jsonify({'success': False, 'error': 'Unauthorized'}), 403
@@ -430,7 +2667,11 @@ def update_seller_profile(seller_id):
         seller.shop_description = data.get('shop_description', seller.shop_description)
         seller.status = data.get('status', seller.status)
         
+        revoke = token_claims_changed(seller)
         db.session.commit()
+        user_cache.invalidate(seller.id)
+        if revoke:
+            token_revocations.revoke(seller.id)
         return jsonify({
             'success': True,
             'message': 'Seller profile updated',
@@ -441,10 +2682,11 @@ def update_seller_profile(seller_id):
 
 
 @app.route('/api/admin/sellers/<int:seller_id>', methods=['DELETE'])
+@token_auth
 def delete_seller_profile(seller_id):
     """Delete seller profile - admin only"""
     admin_id = request.args.get('admin_id')
-    admin = User.query.get(admin_id)
+    admin = acting_user(admin_id)
     
     if not admin or admin.role != 'admin':
         return jsonify({'success': False, 'error': 'Unauthorized'}), 403
@@ -456,6 +2698,8 @@ def delete_seller_profile(seller_id):
     try:
         db.session.delete(seller)
         db.session.commit()
+        user_cache.invalidate(seller_id)
+        token_revocations.revoke(seller_id)
         return jsonify({
             'success': True,
             'message': 'Seller profile deleted'
@@ -467,40 +2711,58 @@ def delete_seller_profile(seller_id):
 # ==================== USER MANAGEMENT (ADMIN ONLY) ====================
 
 @app.route('/api/admin/users', methods=['GET'])
+@token_auth
 def get_all_users():
     """Get all users - admin only"""
     admin_id = request.args.get('admin_id')
-    admin = User.query.get(admin_id)
+    admin = acting_user(admin_id)
 
     if not admin or admin.role != 'admin':
         return jsonify({'success': False, 'error': 'Unauthorized'}), 403
 
-    users = User.query.all()
-    return jsonify({'success': True, 'users': [u.to_dict() for u in users]}), 200
+    try:
+        keys = USER_FIELDS.requested() or list(USER_FIELDS.fields)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    columns = USER_FIELDS.columns(keys)
+    serialize = USER_FIELDS.serializer(keys, columns)
+    users = db.session.query(*columns).order_by(User.id)
+    if wants_stream():
+        return ndjson_response(users, serialize)
+    return jsonify({'success': True, 'users': [serialize(u) for u in users]}), 200
 
 
 @app.route('/api/admin/users/<int:user_id>', methods=['GET'])
+@token_auth
 def get_user(user_id):
     """Get user profile - admin only"""
     admin_id = request.args.get('admin_id')
-    admin = User.query.get(admin_id)
+    admin = acting_user(admin_id)
 
     if not admin or admin.role != 'admin':
         return jsonify({'success': False, 'error': 'Unauthorized'}), 403
 
-    user = User.query.get(user_id)
+    try:
+        keys = USER_FIELDS.requested() or list(USER_FIELDS.fields)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    columns = USER_FIELDS.columns(keys)
+    user = db.session.query(*columns).filter(User.id == user_id).first()
     if not user:
         return jsonify({'success': False, 'error': 'User not found'}), 404
 
-    return jsonify({'success': True, 'user': user.to_dict()}), 200
+    return jsonify({'success': True, 'user': USER_FIELDS.serializer(keys, columns)(user)}), 200
 
 
 @app.route('/api/admin/users/<int:user_id>/promote', methods=['PUT','POST'])
+@token_auth
 def promote_user_to_seller(user_id):
     """Promote a buyer to seller - admin only"""
     data = request.json or {}
     admin_id = data.get('admin_id') or request.args.get('admin_id')
-    admin = User.query.get(admin_id)
+    admin = acting_user(admin_id)
 
     if not admin or admin.role != 'admin':
         return jsonify({'success': False, 'error': 'Unauthorized'}), 403
@@ -518,7 +2780,11 @@ def promote_user_to_seller(user_id):
         user.shop_name = data.get('shop_name', user.shop_name or '')
         user.shop_description = data.get('shop_description', user.shop_description or '')
         user.canUploadStock = True
+        revoke = token_claims_changed(user)
         db.session.commit()
+        user_cache.invalidate(user.id)
+        if revoke:
+            token_revocations.revoke(user.id)
 
         return jsonify({'success': True, 'message': 'User promoted to seller', 'user': user.to_dict()}), 200
     except Exception as e:
@@ -529,11 +2795,12 @@ def promote_user_to_seller(user_id):
 # ==================== USER UPDATE & DELETE (ADMIN ONLY) ====================
 
 @app.route('/api/admin/users/<int:user_id>', methods=['PUT'])
+@token_auth
 def update_user_profile(user_id):
     """Update user profile (username, email, full_name, phone, role, password) - admin only"""
     data = request.json or {}
     admin_id = data.get('admin_id') or request.args.get('admin_id')
-    admin = User.query.get(admin_id)
+    admin = acting_user(admin_id)
 
     if not admin or admin.role != 'admin':
         return jsonify({'success': False, 'error': 'Unauthorized'}), 403
@@ -551,12 +2818,7 @@ def update_user_profile(user_id):
     role = data.get('role')
 
     try:
-        # uniqueness checks
-        if username and username != user.username and User.query.filter_by(username=username).first():
-            return jsonify({'success': False, 'error': 'Username already exists'}), 400
-        if email and email != user.email and User.query.filter_by(email=email).first():
-            return jsonify({'success': False, 'error': 'Email already exists'}), 400
-
+        # A username or email taken by another user fails the unique constraints on commit
         if username:
             user.username = username
         if email:
@@ -577,21 +2839,29 @@ def update_user_profile(user_id):
         if 'password' in data and data.get('password'):
             user.set_password(data.get('password'))
 
+        revoke = token_claims_changed(user)
         db.session.commit()
+        user_cache.invalidate(user.id)
+        if revoke:
+            token_revocations.revoke(user.id)
         return jsonify({'success': True, 'message': 'User updated', 'user': user.to_dict()}), 200
-    except IntegrityError:
+    except IntegrityError as ie:
         db.session.rollback()
-        return jsonify({'success': False, 'error': 'Database integrity error'}), 400
+        return jsonify({'success': False, 'error': duplicate_user_error(ie) or 'Database integrity error'}), 400
+    except PasswordHashBusy:
+        db.session.rollback()
+        return hashing_busy()
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 400
 
 
 @app.route('/api/admin/users/<int:user_id>', methods=['DELETE'])
+@token_auth
 def delete_user_profile(user_id):
     """Delete a user - admin only (cannot delete admin users)"""
     admin_id = request.args.get('admin_id')
-    admin = User.query.get(admin_id)
+    admin = acting_user(admin_id)
 
     if not admin or admin.role != 'admin':
         return jsonify({'success': False, 'error': 'Unauthorized'}), 403
@@ -606,6 +2876,8 @@ def delete_user_profile(user_id):
     try:
         db.session.delete(user)
         db.session.commit()
+        user_cache.invalidate(user_id)
+        token_revocations.revoke(user_id)
         return jsonify({'success': True, 'message': 'User deleted'}), 200
     except Exception as e:
         db.session.rollback()
@@ -613,6 +2885,7 @@ def delete_user_profile(user_id):
 
 
 @app.route('/api/admin/users/<int:user_id>/reset_password', methods=['POST'])
+@token_auth
 def admin_reset_password(user_id):
     """Admin resets their own password by answering 'What is your full name' question"""
     data = request.json or {}
@@ -620,12 +2893,12 @@ def admin_reset_password(user_id):
     full_name_answer = (data.get('full_name_answer') or '').strip()
     new_password = data.get('new_password') or ''
 
-    admin = User.query.get(admin_id)
+    admin = acting_user(admin_id)
     if not admin or admin.role != 'admin':
         return jsonify({'success': False, 'error': 'Unauthorized'}), 403
 
     # Only allow an admin to reset their own admin password via this flow
-    if int(admin_id) != int(user_id):
+    if int(admin.id) != int(user_id):
         return jsonify({'success': False, 'error': 'Can only reset your own admin password via this flow'}), 403
 
     user = User.query.get(user_id)
@@ -641,8 +2914,15 @@ def admin_reset_password(user_id):
 
     try:
         user.set_password(new_password)
+        revoke = token_claims_changed(user)
         db.session.commit()
+        user_cache.invalidate(user.id)
+        if revoke:
+            token_revocations.revoke(user.id)
         return jsonify({'success': True, 'message': 'Password reset successful'}), 200
+    except PasswordHashBusy:
+        db.session.rollback()
+        return hashing_busy()
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 400
@@ -650,51 +2930,95 @@ def admin_reset_password(user_id):
 
 # ==================== ADMIN: SELLER ANALYTICS ====================
 
+def seller_metrics(seller_ids=None):
+    """Product count and average rating per seller in one GROUP BY uploader_id query
+
+    Reads the precomputed rating aggregates on Product rather than joining Rating.
+    Returns {seller_id: (product_count, avg_rating)}; sellers without products are absent.
+    """
+    rating_count = db.func.sum(Product.rating_count)
+    metrics = db.session.query(
+        Product.uploader_id, db.func.count(Product.id), db.func.sum(Product.rating_sum), rating_count
+    )
+    if seller_ids is not None:
+        metrics = metrics.filter(Product.uploader_id.in_(seller_ids))
+
+    return {
+        uploader_id: (count, rating_sum / ratings if ratings else None)
+        for uploader_id, count, rating_sum, ratings in metrics.group_by(Product.uploader_id).all()
+    }
+
+
+def seller_analytics_dict(seller, metrics):
+    product_count, avg_rating = metrics.get(seller.id, (0, None))
+    return {
+        'seller_id': seller.id,
+        'username': seller.username,
+        'email': seller.email,
+        'shop_name': seller.shop_name,
+        'product_count': int(product_count or 0),
+        'avg_rating': float(avg_rating) if avg_rating is not None else None,
+        'date_joined': seller.created_at.strftime('%Y-%m-%d') if seller.created_at else None,
+        'phone': seller.phone or ''
+    }
+
+
+ANALYTICS_SORTS = ('product_count', 'avg_rating', 'date_joined', 'username')
+
+
 @app.route('/api/admin/seller_analytics', methods=['GET'])
+@token_auth
 def admin_seller_analytics():
     """Return analytics for all sellers (admin only)
 
-    Metrics per seller: product_count, avg_rating, date_joined, phone
+    Metrics per seller: product_count, avg_rating, date_joined, phone.
+    Optional: sort (product_count, avg_rating, date_joined, username),
+    order (asc/desc, default desc) and limit/offset.
     """
     admin_id = request.args.get('admin_id')
-    admin = User.query.get(admin_id)
+    admin = acting_user(admin_id)
     if not admin or admin.role != 'admin':
         return jsonify({'success': False, 'error': 'Unauthorized'}), 403
 
+    sort_by = request.args.get('sort')
+    descending = request.args.get('order', 'desc').lower() != 'asc'
+    if sort_by and sort_by not in ANALYTICS_SORTS:
+        return jsonify({'success': False, 'error': 'Invalid sort'}), 400
+    try:
+        limit = int(request.args['limit']) if 'limit' in request.args else None
+        offset = int(request.args.get('offset', 0))
+        if (limit is not None and limit < 1) or offset < 0:
+            raise ValueError
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid limit or offset'}), 400
+
     sellers = User.query.filter_by(role='seller').all()
-    analytics = []
-
-    for s in sellers:
-        # products count
-        product_count = Product.query.filter_by(uploader_id=s.id).count()
-
-        # average rating for seller's products
-        avg_rating = db.session.query(db.func.avg(Rating.rating)).join(
-            Product, Product.id == Rating.productId
-        ).filter(Product.uploader_id == s.id).scalar() or None
-
-        analytics.append({
-            'seller_id': s.id,
-            'username': s.username,
-            'email': s.email,
-            'shop_name': s.shop_name,
-            'product_count': int(product_count or 0),
-            'avg_rating': float(avg_rating) if avg_rating is not None else None,
-            'date_joined': s.created_at.strftime('%Y-%m-%d') if s.created_at else None,
-            'phone': s.phone or ''
-        })
+    metrics = seller_metrics()
+    analytics = [seller_analytics_dict(s, metrics) for s in sellers]
 
-    return jsonify({'success': True, 'analytics': analytics}), 200
+    if sort_by:
+        # Sellers with no value for the key (no ratings yet) always sort last
+        present = [a for a in analytics if a[sort_by] is not None]
+        missing = [a for a in analytics if a[sort_by] is None]
+        present.sort(key=lambda a: a[sort_by], reverse=descending)
+        analytics = present + missing
+
+    total = len(analytics)
+    if limit is not None or offset:
+        analytics = analytics[offset:offset + limit if limit is not None else None]
+
+    return jsonify({'success': True, 'analytics': analytics, 'total': total}), 200
 
 
 @app.route('/api/seller/<int:seller_id>/analytics', methods=['GET'])
+@token_auth
 def seller_analytics(seller_id):
     """Return analytics for a single seller.
 
     Sellers can view their own analytics. Admins can view any seller analytics.
     """
     user_id = request.args.get('user_id')
-    user = User.query.get(user_id)
+    user = acting_user(user_id)
     if not user:
         return jsonify({'success': False, 'error': 'Unauthorized'}), 403
 
@@ -702,71 +3026,119 @@ def seller_analytics(seller_id):
     if user.role != 'admin' and int(user.id) != int(seller_id):
         return jsonify({'success': False, 'error': 'Unauthorized'}), 403
 
-    seller = User.query.get(seller_id)
+    seller = user_cache.get(seller_id)
     if not seller or seller.role != 'seller':
         return jsonify({'success': False, 'error': 'Seller not found'}), 404
 
-    product_count = Product.query.filter_by(uploader_id=seller.id).count()
-    avg_rating = db.session.query(db.func.avg(Rating.rating)).join(
-        Product, Product.id == Rating.productId
-    ).filter(Product.uploader_id == seller.id).scalar() or None
+    analytics = seller_analytics_dict(seller, seller_metrics([seller.id]))
+    return jsonify({'success': True, 'analytics': analytics}), 200
+
 
-    analytics = {
-        'seller_id': seller.id,
-        'username': seller.username,
-        'email': seller.email,
-        'shop_name': seller.shop_name,
-        'product_count': int(product_count or 0),
-        'avg_rating': float(avg_rating) if avg_rating is not None else None,
-        'date_joined': seller.created_at.strftime('%Y-%m-%d') if seller.created_at else None,
-        'phone': seller.phone or ''
-    }
+# ==================== ADMIN: CACHE STATS ====================
 
-    return jsonify({'success': True, 'analytics': analytics}), 200
+@app.route('/api/admin/cache_stats', methods=['GET'])
+@token_auth
+def admin_cache_stats():
+    """Hit/miss counters for this worker's in-process caches (admin only)"""
+    admin_id = request.args.get('admin_id')
+    admin = acting_user(admin_id)
+    if not admin or admin.role != 'admin':
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 403
+
+    return jsonify({
+        'success': True,
+        'pid': os.getpid(),
+        'response_cache': response_cache.stats(),
+        'user_cache': user_cache.stats(),
+        'password_hasher': password_hasher.stats(),
+        'auth_throttle': auth_throttle.stats()
+    }), 200
 
 
 # ==================== PRODUCT ENDPOINTS ====================
 
 @app.route('/api/products', methods=['GET'])
+@catalog_conditional
+@cached_response('catalog')
 def get_products():
-    """Get all products or filter by seller_id"""
+    """Get all products or filter by seller_id
+
+    Pass limit and/or cursor to page through the catalog newest first,
+    stream=1 (or Accept: application/x-ndjson) to stream it as NDJSON, or
+    ids=1,2,3 to fetch specific products in one query.
+    """
+    if 'ids' in request.args:
+        return get_products_by_id()
+    
     seller_id = request.args.get('seller_id')
+    products = Product.query
     
     if seller_id:
         try:
             seller_id = int(seller_id)
-            products = Product.query.filter_by(uploader_id=seller_id).all()
+            products = products.filter_by(uploader_id=seller_id)
         except ValueError:
             return jsonify({'success': False, 'error': 'Invalid seller_id'}), 400
-    else:
-        products = Product.query.all()
     
+    if wants_stream():
+        try:
+            columns, serialize = product_selection(PRODUCT_FIELDS.requested())
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        return ndjson_response(products.with_entities(*columns).order_by(Product.id), serialize)
+    
+    try:
+        listing = product_listing(products, seller_id=seller_id or None)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    return jsonify({'success': True, **listing}), 200
+
+
+def get_products_by_id():
+    """Multi-get for ?ids=: one IN query, results in request order, unknown ids listed as missing"""
+    try:
+        ids = id_list_arg()
+        columns, serialize = product_selection(PRODUCT_FIELDS.requested())
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    found = {row.id: row for row in db.session.query(*columns).filter(Product.id.in_(ids))}
     return jsonify({
         'success': True,
-        'products': [p.to_dict() for p in products]
+        'products': [serialize(found[product_id]) for product_id in ids if product_id in found],
+        'missing': [product_id for product_id in ids if product_id not in found]
     }), 200
 
 
 @app.route('/api/products/<int:product_id>', methods=['GET'])
+@catalog_conditional
+@cached_response('product:{product_id}')
 def get_product(product_id):
-    """Get specific product"""
-    product = Product.query.get(product_id)
+    """Get specific product, optionally limited to ?fields="""
+    try:
+        columns, serialize = product_selection(PRODUCT_FIELDS.requested())
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    product = db.session.query(*columns).filter(Product.id == product_id).first()
     if not product:
         return jsonify({'success': False, 'error': 'Product not found'}), 404
     
     return jsonify({
         'success': True,
-        'product': product.to_dict()
+        'product': serialize(product)
     }), 200
 
 
 @app.route('/api/products', methods=['POST'])
+@token_auth
 def add_product():
     """Add new product - seller only"""
     data = request.json
     user_id = data.get('seller_id') or data.get('user_id')
     
-    user = User.query.get(user_id)
+    user = acting_user(user_id, load=True)  # Contact details default from the seller's profile
     if not user:
         return jsonify({'success': False, 'error': 'User not found'}), 404
     
@@ -790,12 +3162,13 @@ def add_product():
             phone=data.get('phone', user.phone),
             whatsapp=data.get('whatsapp', ''),
             contactMethods=','.join(contactMethods) if contactMethods else '',
-            uploader_id=user_id,
+            uploader_id=user.id,
             uploader_name=user.shop_name or user.full_name or user.username
         )
         
         db.session.add(product)
         db.session.commit()
+        catalog_changed(product.id, product.uploader_id)
         
         return jsonify({
             'success': True,
@@ -807,6 +3180,7 @@ def add_product():
 
 
 @app.route('/api/products/<int:product_id>', methods=['PUT'])
+@token_auth
 def update_product(product_id):
     """Update product - seller or admin only"""
     data = request.json
@@ -816,12 +3190,12 @@ def update_product(product_id):
     if not product:
         return jsonify({'success': False, 'error': 'Product not found'}), 404
     
-    user = User.query.get(user_id)
+    user = acting_user(user_id)
     if not user:
         return jsonify({'success': False, 'error': 'User not found'}), 404
     
     # Only product owner or admin can update
-    if user.role != 'admin' and product.uploader_id != user_id:
+    if user.role != 'admin' and product.uploader_id != user.id:
         return jsonify({'success': False, 'error': 'Unauthorized'}), 403
     
     try:
@@ -840,6 +3214,7 @@ def update_product(product_id):
             product.contactMethods = ','.join(data['contactMethods'])
         
         db.session.commit()
+        catalog_changed(product.id, product.uploader_id)
         return jsonify({
             'success': True,
             'message': 'Product updated successfully',
@@ -850,6 +3225,7 @@ def update_product(product_id):
 
 
 @app.route('/api/products/<int:product_id>', methods=['DELETE'])
+@token_auth
 def delete_product(product_id):
     """Delete product - seller or admin only"""
     # Use silent JSON parsing to avoid BadRequest when Content-Type is present but body is empty
@@ -865,17 +3241,19 @@ def delete_product(product_id):
     if not product:
         return jsonify({'success': False, 'error': 'Product not found'}), 404
     
-    user = User.query.get(user_id)
+    user = acting_user(user_id)
     if not user:
         return jsonify({'success': False, 'error': 'User not found'}), 404
     
     # Only product owner or admin can delete
-    if user.role != 'admin' and product.uploader_id != user_id:
+    if user.role != 'admin' and product.uploader_id != user.id:
         return jsonify({'success': False, 'error': 'Unauthorized'}), 403
     
     try:
+        seller_id = product.uploader_id
         db.session.delete(product)
         db.session.commit()
+        catalog_changed(product_id, seller_id)
         return jsonify({
             'success': True,
             'message': 'Product deleted successfully'
@@ -885,19 +3263,29 @@ def delete_product(product_id):
 
 
 @app.route('/api/seller/<int:seller_id>/products', methods=['GET'])
+@content_conditional
+@cached_response('seller:{seller_id}', 'users')
 def get_seller_products(seller_id):
-    """Get all products by a specific seller"""
-    seller = User.query.get(seller_id)
+    """Get all products by a specific seller
+
+    Pass limit and/or cursor to page through the listings newest first.
+    """
+    seller = user_cache.get(seller_id)
     if not seller or seller.role != 'seller':
         return jsonify({'success': False, 'error': 'Seller not found'}), 404
     
-    products = Product.query.filter_by(uploader_id=seller_id).all()
-    return jsonify({
-        'success': True,
-        'seller': seller.to_dict(),
-        'products': [p.to_dict() for p in products],
-        'product_count': len(products)
-    }), 200
+    try:
+        listing = product_listing(Product.query.filter_by(uploader_id=seller_id), seller_id=seller_id)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    total = listing.pop('total', None)
+    if not wants_pagination():
+        total = len(listing['products'])
+    result = {'success': True, 'seller': seller.to_dict(), **listing}
+    if total is not None:
+        result['product_count'] = total
+    return jsonify(result), 200
 
 
 # ==================== CART ENDPOINTS ====================
@@ -918,6 +3306,7 @@ def get_cart():
 
 
 @app.route('/api/cart', methods=['POST'])
+@idempotent
 def add_to_cart():
     """Add item to cart"""
     data = request.json
@@ -965,8 +3354,14 @@ def remove_from_cart(cart_item_id):
 # ==================== ORDER ENDPOINTS ====================
 
 @app.route('/api/orders', methods=['POST'])
+@idempotent
 def create_order():
-    """Create order from cart"""
+    """Create order from cart
+
+    Reads the cart joined with products in one query, bulk-inserts the
+    order items and clears the cart with a single DELETE, keeping the
+    write transaction short.
+    """
     data = request.json
     user_id = data.get('user_id')
     discount_code = data.get('discountCode')
@@ -974,81 +3369,146 @@ def create_order():
     if not user_id:
         return jsonify({'success': False, 'error': 'User ID required'}), 400
     
-    cart_items = CartItem.query.filter_by(userId=user_id).all()
-    
-    if not cart_items:
-        return jsonify({'success': False, 'error': 'Cart is empty'}), 400
-    
     try:
-        total = 0
-        order = Order(userId=user_id)
-        
-        for cart_item in cart_items:
-            product = cart_item.product
-            order_item = OrderItem(
-                productId=product.id,
-                name=product.name,
-                quantity=cart_item.quantity,
-                price=product.price or 0
-            )
-            total += (product.price or 0) * cart_item.quantity
-            db.session.add(order_item)
-            order.items.append(order_item)
-        
-        # Apply coupon discount if provided
+        # Look up the coupon before any writes so it adds nothing to the lock time
         discount_percent = 0
+        applied_code = None
         if discount_code:
             coupon = Coupon.query.filter_by(code=discount_code.upper(), active=True).first()
             if coupon:
                 discount_percent = coupon.discount
-                order.discountApplied = discount_code.upper()
+                applied_code = discount_code.upper()
+        
+        lines = db.session.query(
+            CartItem.id, CartItem.quantity, Product.id.label('productId'), Product.name, Product.price
+        ).join(Product, Product.id == CartItem.productId).filter(CartItem.userId == user_id).all()
+        
+        if not lines:
+            return jsonify({'success': False, 'error': 'Cart is empty'}), 400
+        
+        total = sum((line.price or 0) * line.quantity for line in lines)
         
         # Calculate final total with discount
         if discount_percent > 0:
             total = total * (1 - discount_percent / 100)
         
-        order.total = total
+        order = Order(userId=user_id, total=total, discountApplied=applied_code)
         db.session.add(order)
+        db.session.flush()  # Assigns order.id for the item rows
+        
+        items = [{
+            'orderId': order.id,
+            'productId': line.productId,
+            'name': line.name,
+            'quantity': line.quantity,
+            'price': line.price or 0.0
+        } for line in lines]
+        db.session.execute(db.insert(OrderItem), items)
         
-        # Clear cart
-        for item in cart_items:
-            db.session.delete(item)
+        # Clear exactly the lines that were ordered, in one statement
+        CartItem.query.filter(CartItem.id.in_([line.id for line in lines])).delete(synchronize_session=False)
         
+        order_dict = {
+            'id': order.id,
+            'items': [{'name': item['name'], 'quantity': item['quantity'], 'price': item['price']} for item in items],
+            'total': order.total,
+            'status': order.status,
+            'date': order.createdAt.strftime('%Y-%m-%d %H:%M:%S'),
+            'discountApplied': order.discountApplied
+        }
         db.session.commit()
         return jsonify({
             'success': True,
             'message': 'Order placed successfully',
-            'order': order.to_dict()
+            'order': order_dict
         }), 201
     except Exception as e:
+        db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 400
 
 
+def order_rows_to_dicts(rows, keys, serialize):
+    """Serialize sparse order rows, batch-loading items when they were asked for"""
+    orders = [serialize(row) for row in rows]
+    if 'items' in keys:
+        items = order_items_by_order([row.id for row in rows])
+        for row, order in zip(rows, orders):
+            order['items'] = items[row.id]
+    return orders
+
+
 @app.route('/api/orders', methods=['GET'])
 def get_orders():
-    """Get user's orders"""
+    """Get user's orders
+
+    Items are batch-loaded with one extra SELECT ... IN query. Pass limit
+    and/or cursor to page newest first, summary=1 for order headers with
+    item counts only, and fields= to pick the keys returned.
+    """
     user_id = request.args.get('user_id')
     
     if not user_id:
         return jsonify({'success': False, 'error': 'User ID required'}), 400
     
-    orders = Order.query.filter_by(userId=user_id).all()
-    return jsonify({
+    try:
+        keys = ORDER_FIELDS.requested()
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    summary = request.args.get('summary', '').lower() in ('1', 'true', 'yes')
+    if keys is None and not summary:
+        orders = Order.query.options(selectinload(Order.items)).filter_by(userId=user_id)
+        serialize_page = lambda page: [order.to_dict() for order in page]
+    else:
+        keys = keys or ORDER_SUMMARY_KEYS
+        columns = ORDER_FIELDS.columns(keys, Order.createdAt, Order.id)
+        orders = db.session.query(*columns).filter(Order.userId == user_id)
+        serialize = ORDER_FIELDS.serializer(keys, columns)
+        serialize_page = lambda page: order_rows_to_dicts(page, keys, serialize)
+    
+    if not wants_pagination():
+        return jsonify({
+            'success': True,
+            'orders': serialize_page(orders.order_by(Order.id).all())
+        }), 200
+    
+    try:
+        limit, position, with_total = parse_page_args()
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    page, next_cursor = keyset_page(orders, Order.createdAt, Order.id, limit, position)
+    result = {
         'success': True,
-        'orders': [order.to_dict() for order in orders]
-    }), 200
+        'orders': serialize_page(page),
+        'next_cursor': next_cursor
+    }
+    if with_total:
+        result['total'] = count_rows(Order.query.filter_by(userId=user_id), Order.id)
+    return jsonify(result), 200
 
 
 @app.route('/api/orders/<int:order_id>', methods=['GET'])
 def get_order(order_id):
-    """Get specific order"""
-    order = Order.query.get(order_id)
+    """Get specific order, optionally limited to ?fields="""
+    try:
+        keys = ORDER_FIELDS.requested()
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    if keys is None:
+        order = Order.query.get(order_id)
+        order = order.to_dict() if order else None
+    else:
+        columns = ORDER_FIELDS.columns(keys, Order.id)
+        row = db.session.query(*columns).filter(Order.id == order_id).first()
+        order = order_rows_to_dicts([row], keys, ORDER_FIELDS.serializer(keys, columns))[0] if row else None
     if not order:
         return jsonify({'success': False, 'error': 'Order not found'}), 404
     
     return jsonify({
         'success': True,
-        'order': order.to_dict()
+        'order': order
     }), 200
 
 
@@ -1058,6 +3518,8 @@ def get_order(order_id):
 # ==================== RATING ENDPOINTS ====================
 
 @app.route('/api/ratings/<int:product_id>', methods=['GET'])
+@catalog_conditional
+@cached_response('product:{product_id}')
 def get_product_ratings(product_id):
     """Get all ratings for a product"""
     product = Product.query.get(product_id)
@@ -1071,6 +3533,30 @@ def get_product_ratings(product_id):
     }), 200
 
 
+@app.route('/api/ratings/summary', methods=['GET'])
+@catalog_conditional
+@cached_response('catalog')
+def get_rating_summaries():
+    """Rating aggregates for ?ids=1,2,3 from one IN query over the stored per-product counts"""
+    try:
+        ids = id_list_arg()
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    if ids is None:
+        return jsonify({'success': False, 'error': 'ids required'}), 400
+    
+    rating_columns = PRODUCT_FIELDS.fields['rating'][0]
+    found = {
+        row[0]: rating_summary(*row[1:])
+        for row in db.session.query(Product.id, *rating_columns).filter(Product.id.in_(ids))
+    }
+    return jsonify({
+        'success': True,
+        'ratings': [{'product_id': product_id, **found[product_id]} for product_id in ids if product_id in found],
+        'missing': [product_id for product_id in ids if product_id not in found]
+    }), 200
+
+
 @app.route('/api/ratings', methods=['POST'])
 def add_rating():
     """Add rating/review to product"""
@@ -1083,6 +3569,13 @@ def add_rating():
     if not product_id or not rating:
         return jsonify({'success': False, 'error': 'Product ID and rating required'}), 400
     
+    try:
+        rating = int(rating)
+    except (ValueError, TypeError):
+        rating = None
+    if rating not in (1, 2, 3, 4, 5):
+        return jsonify({'success': False, 'error': 'Rating must be a whole number from 1 to 5'}), 400
+    
     product = Product.query.get(product_id)
     if not product:
         return jsonify({'success': False, 'error': 'Product not found'}), 404
@@ -1095,7 +3588,17 @@ def add_rating():
             review=review
         )
         db.session.add(new_rating)
+        # Bump the aggregates in SQL within the same transaction so concurrent
+        # ratings cannot overwrite each other's counts
+        histogram_column = getattr(Product, f'rating_{rating}')
+        seller_id = product.uploader_id
+        Product.query.filter_by(id=product.id).update({
+            Product.rating_count: Product.rating_count + 1,
+            Product.rating_sum: Product.rating_sum + rating,
+            histogram_column: histogram_column + 1
+        }, synchronize_session=False)
         db.session.commit()
+        catalog_changed(product_id, seller_id)
         
         return jsonify({
             'success': True,
@@ -1103,6 +3606,7 @@ def add_rating():
             'rating': new_rating.to_dict()
         }), 201
     except Exception as e:
+        db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 400
 
 
@@ -1165,38 +3669,194 @@ def validate_coupon():
 
 # ==================== SEARCH & FILTER ENDPOINTS ====================
 
+SEARCH_SORTS = ('relevance', 'newest', 'price-low', 'price-high', 'rating')
+
+
+@app.route('/api/search/suggest', methods=['GET'])
+@catalog_conditional
+def search_suggest():
+    """Typeahead completions for ?q= from the in-memory prefix index
+
+    Returns matching categories (by product count) and products (by rating
+    count, then average rating), at most `limit` of each.
+    """
+    query = request.args.get('q', '').strip()
+    try:
+        limit = min(int(request.args.get('limit', 8)), app.config['SUGGEST_LIMIT_MAX'])
+        if limit < 1:
+            raise ValueError
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid limit'}), 400
+    
+    if not query:
+        return jsonify({'success': True, 'query': query, 'categories': [], 'products': []}), 200
+    
+    categories, products = suggest_index.suggest(query, limit)
+    return jsonify({
+        'success': True,
+        'query': query,
+        'categories': [{'category': category, 'count': count} for category, count in categories],
+        'products': [{'id': product_id, 'name': name, 'category': category} for product_id, name, category in products]
+    }), 200
+
+
+def search_facets(matched, category, min_price, max_price, edges):
+    """Category counts and price histogram for a search, from one GROUP BY.
+
+    Each facet ignores its own filter (category counts apply the price
+    range, the histogram applies the category) so the sidebar can offer
+    the alternatives. Returns ({category: count}, [count per price bucket]).
+    """
+    bucket = db.case(
+        (Product.sortPrice.is_(None), -1),
+        *[(Product.sortPrice < edge, i) for i, edge in enumerate(edges[1:])],
+        else_=len(edges) - 1
+    )
+    in_range = db.true()
+    if min_price is not None:
+        in_range = in_range & (Product.sortPrice >= min_price)
+    if max_price is not None:
+        in_range = in_range & (Product.sortPrice <= max_price)
+    
+    groups = matched.order_by(None).with_entities(
+        Product.category, bucket, db.case((in_range, 1), else_=0), db.func.count()
+    ).group_by(Product.category, bucket, db.case((in_range, 1), else_=0))
+    
+    categories = {}
+    histogram = [0] * len(edges)
+    for name, price_bucket, within_range, count in groups:
+        if within_range and name is not None:
+            categories[name] = categories.get(name, 0) + count
+        if price_bucket >= 0 and (not category or name == category):
+            histogram[price_bucket] += count
+    return categories, histogram
+
+
+def facets_dict(categories, histogram, edges):
+    return {
+        'categories': [{'category': name, 'count': count}
+                       for name, count in sorted(categories.items(), key=lambda item: (-item[1], item[0]))],
+        'price': [{'min': edge, 'max': edges[i + 1] if i + 1 < len(edges) else None, 'count': histogram[i]}
+                  for i, edge in enumerate(edges)]
+    }
+
+
+def search_page_info(offset, returned, has_more):
+    """Paging fields of a search response: has_more, and next_offset when it is true"""
+    return {'has_more': has_more, 'next_offset': offset + returned if has_more else None}
+
+
 @app.route('/api/search', methods=['GET'])
+@catalog_conditional
+@cached_response('catalog')
 def search_products():
-    """Search products by name or description"""
+    """Search products by name or description
+
+    Uses the FTS5 index when available (BM25 ranked, prefix matched, with
+    highlighted snippets) and falls back to LIKE otherwise. Filtering,
+    sorting and limit/offset are all applied in SQL; a page holds at most
+    PAGE_SIZE_DEFAULT results unless limit says otherwise, and has_more /
+    next_offset tell the client whether to fetch another. With stream=1 (or
+    Accept: application/x-ndjson) every match is streamed as NDJSON unless
+    limit/offset are given explicitly. facets=1 adds category counts and a
+    price histogram for the query.
+    """
     query = request.args.get('q', '').lower()
     category = request.args.get('category', '')
-    sort_by = request.args.get('sort', 'newest')
+    match = fts_match_expression(query) if query and fts_available() else ''
+    sort_by = request.args.get('sort', 'relevance' if match else 'newest')
+    if sort_by not in SEARCH_SORTS or (sort_by == 'relevance' and not match):
+        sort_by = 'newest'
     
-    products = Product.query
+    try:
+        min_price = float_arg('min_price')
+        max_price = float_arg('max_price')
+        limit = min(int(request.args.get('limit', app.config['PAGE_SIZE_DEFAULT'])), app.config['PAGE_SIZE_MAX'])
+        offset = int(request.args.get('offset', 0))
+        if limit < 1 or offset < 0:
+            raise ValueError
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid price, limit or offset'}), 400
+    
+    try:
+        keys = PRODUCT_FIELDS.requested()
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    columns, serialize = product_selection(keys)
+    stream = wants_stream()
+    with_facets = not stream and request.args.get('facets', '').lower() in ('1', 'true', 'yes')
+    edges = app.config['FACET_PRICE_EDGES']
     
-    if query:
-        products = products.filter(
-            (Product.name.ilike(f'%{query}%')) |
-            (Product.description.ilike(f'%{query}%'))
+    if not query and not stream and catalog_engine_active():
+        rows, total, _ = catalog_engine.query(
+            category=category or None, min_price=min_price, max_price=max_price,
+            sort_by=sort_by, offset=offset, limit=limit
         )
+        if keys:
+            rows = [project(row, keys) for row in rows]
+        result = {'success': True, 'products': rows, 'sort': sort_by}
+        result.update(search_page_info(offset, len(rows), offset + len(rows) < total))
+        if with_facets:
+            result['facets'] = facets_dict(*catalog_engine.facets(category or None, min_price, max_price, edges), edges)
+        return jsonify(result), 200
     
-    if category:
-        products = products.filter_by(category=category)
+    fts = literal_column('product_fts')
+    if match:
+        products = db.session.query(
+            *columns, db.func.snippet(fts, -1, '\x02', '\x03', '...', 12).label('snippet')
+        ).join(product_fts, product_fts.c.rowid == Product.id).filter(fts.op('MATCH')(match))
+    else:
+        products = db.session.query(*columns)
+        if query:
+            products = products.filter(
+                (Product.name.ilike(f'%{query}%')) |
+                (Product.description.ilike(f'%{query}%'))
+            )
+    matched = products
     
-    products = products.all()
+    if category:
+        products = products.filter(Product.category == category)
+    if min_price is not None:
+        products = products.filter(Product.sortPrice >= min_price)
+    if max_price is not None:
+        products = products.filter(Product.sortPrice <= max_price)
     
     # Sort products
-    if sort_by == 'price-low':
-        products.sort(key=lambda p: p.price or p.priceMin or 0)
+    if sort_by == 'relevance':
+        products = products.order_by(db.func.bm25(fts, 10.0, 1.0))  # Name hits weigh more than description hits
+    elif sort_by == 'price-low':
+        products = products.order_by(Product.sortPrice.asc(), Product.id.asc())
     elif sort_by == 'price-high':
-        products.sort(key=lambda p: p.price or p.priceMax or 0, reverse=True)
+        products = products.order_by(Product.sortPriceHigh.desc(), Product.id.desc())
+    elif sort_by == 'rating':
+        avg_rating = db.case(
+            (Product.rating_count > 0, Product.rating_sum * 1.0 / Product.rating_count), else_=0
+        )
+        products = products.order_by(avg_rating.desc(), Product.rating_count.desc(), Product.id.desc())
     else:  # newest
-        products.sort(key=lambda p: p.createdAt or datetime.utcnow(), reverse=True)
+        products = products.order_by(Product.createdAt.desc(), Product.id.desc())
     
-    return jsonify({
+    def search_item(row):
+        item = serialize(row)
+        if match:
+            item['snippet'] = highlight_snippet(row.snippet)
+        return item
+    
+    if stream:
+        if 'limit' in request.args or offset:
+            products = products.limit(limit).offset(offset)
+        return ndjson_response(products, search_item)
+    
+    rows = products.limit(limit + 1).offset(offset).all()  # One extra row tells whether more follow
+    result = {
         'success': True,
-        'products': [p.to_dict() for p in products]
-    }), 200
+        'products': [search_item(row) for row in rows[:limit]],
+        'sort': sort_by
+    }
+    result.update(search_page_info(offset, min(len(rows), limit), len(rows) > limit))
+    if with_facets:
+        result['facets'] = facets_dict(*search_facets(matched, category, min_price, max_price, edges), edges)
+    return jsonify(result), 200
 
 
 # ==================== EXPORT/IMPORT ENDPOINTS ====================
@@ -1217,7 +3877,7 @@ def export_data():
         export_data_dict = {
             'user': user.to_dict(),
             'products': [p.to_dict() for p in user.products],
-            'orders': [o.to_dict() for o in Order.query.filter_by(userId=user_id).all()],
+            'orders': [o.to_dict() for o in Order.query.options(selectinload(Order.items)).filter_by(userId=user_id).all()],
             'ratings': [r.to_dict() for r in Rating.query.filter_by(userId=user_id).all()],
             'profile': UserProfile.query.filter_by(userId=user_id).first().to_dict() if UserProfile.query.filter_by(userId=user_id).first() else {}
         }
@@ -1264,34 +3924,183 @@ def health():
 
 # ==================== FRONTEND ROUTES ====================
 
+class StaticAsset:
+    """A frontend file held in memory with precompressed variants"""
+
+    def __init__(self, path, mimetype, body):
+        self.path = path
+        self.mimetype = mimetype
+        self.mtime = os.stat(path).st_mtime
+        self.last_modified = datetime.fromtimestamp(int(self.mtime), tz=timezone.utc)
+        self.digest = hashlib.sha256(body).hexdigest()[:20]
+        self.variants = {'identity': body, 'gzip': gzip.compress(body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.variants['br'] = brotli.compress(body, quality=11)
+
+
+class StaticAssetStore:
+    """Serves index.html, styles.css and app.js from memory.
+
+    Files are read and compressed once at startup (and again when they change
+    on disk while running in debug mode). index.html is rewritten to load
+    styles.css and app.js with a ?v=<content hash> suffix, so those URLs can
+    be cached for a year while index.html itself is always revalidated.
+    """
+
+    ASSETS = {
+        'styles.css': 'text/css; charset=utf-8',
+        'app.js': 'text/javascript; charset=utf-8',
+        'index.html': 'text/html; charset=utf-8',  # Last: its references embed the other hashes
+    }
+
+    def __init__(self, root):
+        self.root = root
+        self.assets = {}
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        assets = {}
+        for name, mimetype in self.ASSETS.items():
+            path = os.path.join(self.root, name)
+            try:
+                with open(path, 'rb') as f:
+                    body = f.read()
+            except OSError:
+                continue
+            if name == 'index.html':
+                body = self.versioned_index(body, assets)
+            assets[name] = StaticAsset(path, mimetype, body)
+        with self.lock:
+            self.assets = assets
+
+    @staticmethod
+    def versioned_index(body, assets):
+        text = body.decode('utf-8')
+        for name in ('styles.css', 'app.js'):
+            if name in assets:
+                text = re.sub(
+                    r'(href|src)="' + re.escape(name) + '"',
+                    lambda m, name=name: f'{m.group(1)}="{name}?v={assets[name].digest}"',
+                    text
+                )
+        return text.encode('utf-8')
+
+    def get(self, name):
+        if app.debug:
+            asset = self.assets.get(name)
+            path = asset.path if asset else os.path.join(self.root, name)
+            try:
+                changed = asset is None or os.stat(path).st_mtime != asset.mtime
+            except OSError:
+                changed = asset is not None
+            if changed:
+                self.load()
+        return self.assets.get(name)
+
+
+static_assets = StaticAssetStore(os.path.dirname(os.path.abspath(__file__)))
+
+
+def negotiate_encoding(available):
+    """Pick the best Content-Encoding from Accept-Encoding among the available variants"""
+    for encoding in ('br', 'gzip'):
+        if encoding in available and request.accept_encodings[encoding] > 0:
+            return encoding
+    return 'identity'
+
+
+def serve_static_asset(name):
+    asset = static_assets.get(name)
+    if asset is None:
+        return jsonify({'error': f'{name} not found'}), 404
+
+    encoding = negotiate_encoding(asset.variants)
+    etag = asset.digest if encoding == 'identity' else f'{asset.digest}-{encoding}'
+
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(asset.variants[encoding])
+        response.headers['Content-Type'] = asset.mimetype
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.last_modified = asset.last_modified
+    response.vary.add('Accept-Encoding')
+
+    # Hash-versioned URLs never change content; everything else revalidates
+    if name != 'index.html' and request.args.get('v') == asset.digest:
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
 @app.route('/', methods=['GET'])
 @app.route('/index.html', methods=['GET'])
 def serve_index():
     """Serve index.html"""
-    try:
-        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'index.html'), 'r') as f:
-            return f.read()
-    except:
-        return jsonify({'error': 'index.html not found'}), 404
+    return serve_static_asset('index.html')
 
 @app.route('/styles.css', methods=['GET'])
 def serve_styles():
     """Serve styles.css"""
-    try:
-        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'styles.css'), 'r') as f:
-            return f.read(), 200, {'Content-Type': 'text/css'}
-    except:
-        return jsonify({'error': 'styles.css not found'}), 404
+    return serve_static_asset('styles.css')
 
 @app.route('/app.js', methods=['GET'])
 def serve_app_js():
     """Serve app.js"""
-    try:
-        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.js'), 'r') as f:
-            return f.read(), 200, {'Content-Type': 'text/javascript'}
-    except:
-        return jsonify({'error': 'app.js not found'}), 404
+    return serve_static_asset('app.js')
+
+
+
+# ==================== RESPONSE COMPRESSION ====================
 
+def compress_body(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=app.config['COMPRESS_BROTLI_QUALITY'])
+    return gzip.compress(body, compresslevel=app.config['COMPRESS_LEVEL'])
+
+
+@app.after_request
+def compress_response(response):
+    """Gzip/Brotli-encode API responses the client accepts.
+
+    Only buffered 2xx responses whose mimetype is in COMPRESS_MIMETYPES and
+    whose body reaches COMPRESS_MIN_SIZE are touched; streamed, passthrough
+    and already-encoded responses are left alone. A strong ETag gets the
+    encoding appended so each variant validates separately. Bodies from the
+    response cache are compressed once per encoding and reused.
+    """
+    if (response.status_code < 200 or response.status_code >= 300 or response.status_code == 204
+            or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in app.config['COMPRESS_MIMETYPES']):
+        return response
+
+    body = response.get_data()
+    if len(body) < app.config['COMPRESS_MIN_SIZE']:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding(('br', 'gzip') if brotli is not None else ('gzip',))
+    if encoding == 'identity':
+        return response
+
+    cached = g.get('encoded_bodies')
+    if cached is not None and cached[0] == body:
+        encoded = cached[1]
+        if encoding not in encoded:
+            encoded[encoding] = compress_body(body, encoding)
+        response.set_data(encoded[encoding])
+    else:
+        response.set_data(compress_body(body, encoding))
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f'{etag}-{encoding}', weak)
+    return response
 
 
 # ==================== ERROR HANDLERS ====================
@@ -1312,6 +4121,10 @@ def forbidden(error):
 def not_found(error):
     return jsonify({'success': False, 'error': 'Not found'}), 404
 
+@app.errorhandler(PasswordHashBusy)
+def password_hash_busy(error):
+    return hashing_busy()
+
 @app.errorhandler(500)
 def server_error(error):
     print(f"Server error: {str(error)}")
@@ -1327,7 +4140,7 @@ def after_request(response):
     """Add CORS headers to response"""
     response.headers['Access-Control-Allow-Origin'] = '*'
     response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
-    response.headers['Access-Control-Allow-Headers'] = 'Content-Type'
+    response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Idempotency-Key, Authorization'
     return response
 
 
@@ -1380,8 +4193,20 @@ def init_admin():
 
 # ==================== MAIN ====================
 
+# Gunicorn workers import this module without running __main__, so apply any
+# pending migrations on import. Once the schema is current this is one PRAGMA
+# read per database. Set SHOP_MIGRATE_ON_BOOT=0 to migrate only via the CLI.
+if os.environ.get('SHOP_MIGRATE_ON_BOOT', '1') == '1':
+    with app.app_context():
+        run_migrations()
+
+# Load the read models now rather than on the first request that needs them
+suggest_index.start()
+if app.config['CATALOG_ENGINE'] and catalog_engine is not None:
+    catalog_engine.start()
+
+
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
         init_admin()
     app.run(debug=True, host='127.0.0.1', port=5000)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Catalog read benchmark: SQL path vs the in-memory columnar catalog engine.
+Runs against throwaway databases in a temp directory, never the real ones.
+
+Usage: python bench_catalog.py [product_count] [runs]
+"""
+import sys
+import os
+import io
+import time
+import random
+import shutil
+import tempfile
+import statistics
+import contextlib
+from datetime import datetime, timedelta
+
+tmp_dir = tempfile.mkdtemp(prefix='shop-bench-')
+os.environ['AUTH_DATABASE_URL'] = 'sqlite:///' + os.path.join(tmp_dir, 'auth.db')
+os.environ['PRODUCTS_DATABASE_URL'] = 'sqlite:///' + os.path.join(tmp_dir, 'products.db')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend import app, db, Product, User, catalog_engine, response_cache
+
+PRODUCTS = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+RUNS = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+CATEGORIES = ['Electronics', 'Books', 'Sports', 'Clothing', 'Home', 'Toys']
+SELLERS = 200
+
+
+def seed():
+    random.seed(42)
+    start = datetime(2024, 1, 1)
+    with app.app_context():
+        seller = User(username='bench_seller', email='bench@example.com', role='seller', status='active',
+                      password_hash='x')
+        db.session.add(seller)
+        db.session.commit()
+        seller_id = seller.id
+
+        rows = []
+        for i in range(PRODUCTS):
+            price = round(random.uniform(1, 500), 2)
+            count = random.randint(0, 20)
+            rows.append({
+                'name': 'Bench product %d' % i,
+                'category': random.choice(CATEGORIES),
+                'description': 'Benchmark listing %d' % i,
+                'priceType': 'fixed',
+                'price': price,
+                'sortPrice': price,
+                'sortPriceHigh': price,
+                'uploader_id': seller_id if i % SELLERS == 0 else 1000 + i % SELLERS,
+                'createdAt': start + timedelta(seconds=i * 7),
+                'rating_count': count,
+                'rating_sum': count * random.randint(1, 5)
+            })
+        db.session.execute(db.insert(Product), rows)
+        db.session.commit()
+        return seller_id
+
+
+def time_get(client, url):
+    timings = []
+    for _ in range(RUNS):
+        response_cache.entries.clear()  # Time the read path, not a response cache hit
+        with contextlib.redirect_stdout(io.StringIO()):  # Silence request logging
+            start = time.perf_counter()
+            response = client.get(url)
+            timings.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            print("[FAIL] %s returned %d" % (url, response.status_code))
+            sys.exit(1)
+    return statistics.median(timings)
+
+
+def deep_cursor(client):
+    """Cursor for the page after the first 200 products, taken from the SQL path"""
+    app.config['CATALOG_ENGINE'] = False
+    with contextlib.redirect_stdout(io.StringIO()):
+        return client.get('/api/products?count=0&limit=%d' % min(200, PRODUCTS)).get_json()['next_cursor']
+
+
+def main():
+    seller_id = seed()
+    client = app.test_client()
+
+    cursor = deep_cursor(client)
+    cases = [
+        ('first page', '/api/products?limit=50'),
+        ('next page, no count', '/api/products?limit=50&count=0&cursor=%s' % cursor),
+        ('seller page', '/api/seller/%d/products?limit=50' % seller_id),
+        ('search category+price', '/api/search?category=Books&min_price=50&max_price=150&sort=price-low&limit=50'),
+        ('search top rated', '/api/search?sort=rating&limit=20'),
+        ('search price-high', '/api/search?sort=price-high&limit=50&offset=200'),
+    ]
+
+    print("=" * 70)
+    print("CATALOG BENCHMARK (%d products, median of %d runs)" % (PRODUCTS, RUNS))
+    print("=" * 70)
+    if catalog_engine is None:
+        print("NumPy is not installed; only the SQL path can be measured.\n")
+
+    with app.app_context():
+        if catalog_engine is not None:
+            start = time.perf_counter()
+            catalog_engine.sync(wait=True)
+            print("Engine load: %.1f ms\n" % ((time.perf_counter() - start) * 1000))
+
+    print("%-26s %12s %12s %9s" % ('case', 'sql ms', 'engine ms', 'speedup'))
+    for label, url in cases:
+        app.config['CATALOG_ENGINE'] = False
+        sql_ms = time_get(client, url)
+        if catalog_engine is None:
+            print("%-26s %12.2f %12s %9s" % (label, sql_ms, '-', '-'))
+            continue
+        app.config['CATALOG_ENGINE'] = True
+        engine_ms = time_get(client, url)
+        print("%-26s %12.2f %12.2f %8.1fx" % (label, sql_ms, engine_ms, sql_ms / engine_ms))
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
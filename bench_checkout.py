@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Checkout benchmark: POST /api/orders latency against cart size.
+Runs against throwaway databases in a temp directory, never the real ones.
+
+Usage: python bench_checkout.py [runs_per_size]
+"""
+import sys
+import os
+import io
+import time
+import tempfile
+import shutil
+import statistics
+import contextlib
+
+tmp_dir = tempfile.mkdtemp(prefix='shop-bench-')
+os.environ['AUTH_DATABASE_URL'] = 'sqlite:///' + os.path.join(tmp_dir, 'auth.db')
+os.environ['PRODUCTS_DATABASE_URL'] = 'sqlite:///' + os.path.join(tmp_dir, 'products.db')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend import app, db, Product, CartItem
+
+CART_SIZES = [1, 10, 50, 200, 1000]
+RUNS = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+USER_ID = 1
+
+
+def seed_products(count):
+    with app.app_context():
+        db.session.execute(db.insert(Product), [{
+            'name': 'Bench product %d' % i,
+            'category': 'Bench',
+            'priceType': 'fixed',
+            'price': 10.0 + i,
+            'sortPrice': 10.0 + i,
+            'uploader_id': 1
+        } for i in range(count)])
+        db.session.commit()
+        return [row[0] for row in db.session.query(Product.id).all()]
+
+
+def fill_cart(product_ids):
+    with app.app_context():
+        db.session.execute(db.insert(CartItem), [
+            {'userId': USER_ID, 'productId': product_id, 'quantity': 2} for product_id in product_ids
+        ])
+        db.session.commit()
+
+
+def main():
+    product_ids = seed_products(max(CART_SIZES))
+    client = app.test_client()
+
+    print("=" * 60)
+    print("CHECKOUT BENCHMARK (%d runs per cart size)" % RUNS)
+    print("=" * 60)
+    print("%10s %12s %12s %12s" % ('cart size', 'median ms', 'p95 ms', 'ms/line'))
+
+    for size in CART_SIZES:
+        timings = []
+        for _ in range(RUNS):
+            fill_cart(product_ids[:size])
+            with contextlib.redirect_stdout(io.StringIO()):  # Silence request logging
+                start = time.perf_counter()
+                response = client.post('/api/orders', json={'user_id': USER_ID, 'discountCode': 'SAVE10'})
+                timings.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 201:
+                print("[FAIL] checkout returned %d: %s" % (response.status_code, response.get_json()))
+                sys.exit(1)
+        timings.sort()
+        median = statistics.median(timings)
+        p95 = timings[int(len(timings) * 0.95) - 1] if len(timings) > 1 else timings[0]
+        print("%10d %12.2f %12.2f %12.3f" % (size, median, p95, median / size))
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
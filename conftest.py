@@ -0,0 +1,81 @@
+"""
+Pytest setup: run the backend against throwaway databases in a temp directory.
+The older test_*.py files are standalone diagnostic scripts (run them with
+python directly), so pytest skips them.
+"""
+import io
+import os
+import sys
+import tempfile
+import contextlib
+
+import pytest
+
+collect_ignore = ['test_backend.py', 'test_login.py', 'test_login_comprehensive.py', 'test_login_simple.py']
+
+tmp_dir = tempfile.mkdtemp(prefix='shop-test-')
+os.environ['AUTH_DATABASE_URL'] = 'sqlite:///' + os.path.join(tmp_dir, 'auth.db')
+os.environ['PRODUCTS_DATABASE_URL'] = 'sqlite:///' + os.path.join(tmp_dir, 'products.db')
+os.environ.setdefault('SHOP_PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')  # Keep logins fast
+os.environ.setdefault('SHOP_PASSWORD_HASH_WORKERS', '0')
+os.environ['SHOP_SECRET_KEY'] = 'test-secret-key'
+os.environ['SHOP_PASSWORD_HASH_SLOT_DIR'] = os.path.join(tmp_dir, 'hash-slots')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import backend  # noqa: E402
+from backend import app, db, User, Product  # noqa: E402
+
+with app.app_context(), contextlib.redirect_stdout(io.StringIO()):
+    backend.init_admin()
+
+
+@pytest.fixture
+def client():
+    """Test client with empty response/user caches and throttle counters"""
+    backend.response_cache.entries.clear()
+    backend.user_cache.entries.clear()
+    backend.auth_throttle.counters = backend.WindowCounters(app.config['AUTH_THROTTLE_MAX_KEYS'])
+    with contextlib.redirect_stdout(io.StringIO()):  # Silence request logging
+        yield app.test_client()
+
+
+@pytest.fixture
+def make_user():
+    """Create an active user and return (id, username)"""
+    counter = iter(range(1, 10 ** 6))
+
+    def make(role='buyer', password='secret'):
+        with app.app_context():
+            n = next(counter)
+            name = f'{role}{n}-{os.urandom(3).hex()}'
+            user = User(username=name, email=f'{name}@example.com', role=role, status='active',
+                        canUploadStock=role == 'seller')
+            user.set_password(password)
+            db.session.add(user)
+            db.session.commit()
+            return user.id, user.username
+    return make
+
+
+@pytest.fixture
+def make_product():
+    """Create a product (fixed-price unless told otherwise) and return its id"""
+    def make(seller_id, name='Test product', category='Books', price=10.0, priceType='fixed', **fields):
+        with app.app_context():
+            product = Product(name=name, category=category, priceType=priceType, price=price,
+                              uploader_id=seller_id, uploader_name='seller', **fields)
+            db.session.add(product)
+            db.session.commit()
+            backend.catalog_changed(product.id, seller_id)
+            return product.id
+    return make
+
+
+@pytest.fixture
+def login(client):
+    """Log a user in and return Bearer headers for its token"""
+    def log_in(username, password='secret'):
+        response = client.post('/api/auth/login', json={'username': username, 'password': password})
+        assert response.status_code == 200, response.get_json()
+        return {'Authorization': 'Bearer ' + response.get_json()['token']}
+    return log_in
@@ -0,0 +1,83 @@
+"""Login/signup throttle: 429 with Retry-After, per IP and per username, before any hashing"""
+import backend
+from backend import app, AuthThrottle, SharedWindowCounters, WindowCounters
+
+
+def attempt(client, username, ip='10.0.0.1'):
+    return client.post('/api/auth/login', json={'username': username, 'password': 'wrong'},
+                       environ_base={'REMOTE_ADDR': ip})
+
+
+def test_username_limit(client, monkeypatch):
+    monkeypatch.setitem(app.config, 'AUTH_THROTTLE_USER_LIMIT', 3)
+    codes = [attempt(client, 'victim', ip=f'10.1.0.{i}').status_code for i in range(4)]
+    assert codes == [401, 401, 401, 429]
+    assert attempt(client, 'someone-else', ip='10.1.0.9').status_code == 401
+
+
+def test_username_counts_only_failures(client, make_user, monkeypatch):
+    monkeypatch.setitem(app.config, 'AUTH_THROTTLE_USER_LIMIT', 2)
+    _, username = make_user()
+    for i in range(4):
+        response = client.post('/api/auth/login', json={'username': username, 'password': 'secret'},
+                               environ_base={'REMOTE_ADDR': f'10.2.0.{i}'})
+        assert response.status_code == 200
+    assert [attempt(client, username, ip=f'10.2.1.{i}').status_code for i in range(3)] == [401, 401, 429]
+
+
+def test_rejected_attempts_do_not_extend_lockout():
+    throttle = AuthThrottle(60, WindowCounters(100))
+    for i in range(3):
+        assert throttle.check('k', 3, now=600 + i) == 0
+        throttle.record('k', now=600 + i)
+    for i in range(100):  # Someone keeps hammering the locked-out username
+        assert throttle.check('k', 3, now=603 + i * 0.5) > 0
+    # Halfway through the next window the 3 failures weigh 1.5; the flood weighed nothing
+    assert throttle.check('k', 3, now=690) == 0
+
+
+def test_shared_counters_peek(client):
+    counters = SharedWindowCounters()
+    with app.app_context():
+        assert counters.peek('peek-key', 10) == (0, 0)
+        counters.add('peek-key', 10)
+        counters.add('peek-key', 10)
+        assert counters.peek('peek-key', 10) == (2, 0)
+        assert counters.peek('peek-key', 11) == (0, 2)
+        assert counters.peek('peek-key', 12) == (0, 0)
+
+
+def test_ip_limit(client, monkeypatch):
+    monkeypatch.setitem(app.config, 'AUTH_THROTTLE_IP_LIMIT', 3)
+    codes = [attempt(client, f'user{i}').status_code for i in range(4)]
+    assert codes == [401, 401, 401, 429]
+    assert attempt(client, 'user9', ip='10.0.0.2').status_code == 401
+
+
+def test_rejection_has_retry_after_and_skips_hashing(client, monkeypatch):
+    monkeypatch.setitem(app.config, 'AUTH_THROTTLE_USER_LIMIT', 1)
+    attempt(client, 'flooded')
+
+    def no_hashing(*args):
+        raise AssertionError('password hashed for a throttled request')
+    monkeypatch.setattr(backend.password_hasher, 'verify', no_hashing)
+    response = attempt(client, 'flooded')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+
+
+def test_sliding_window_estimate():
+    throttle = AuthThrottle(60, WindowCounters(100))
+    assert [throttle.hit('k', 5, now=600 + i) for i in range(5)] == [0] * 5
+    assert throttle.hit('k', 5, now=605) > 0  # Sixth attempt in the window
+    # Halfway through the next window last window's 6 attempts weigh 3
+    assert throttle.hit('k', 5, now=690) == 0
+    assert throttle.hit('k', 5, now=691) == 0
+    assert throttle.hit('k', 5, now=692) > 0
+
+
+def test_counters_evict_least_recently_used():
+    counters = WindowCounters(2)
+    for key in ('a', 'b', 'c'):
+        counters.add(key, 1)
+    assert list(counters.entries) == ['b', 'c']
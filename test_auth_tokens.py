@@ -0,0 +1,78 @@
+"""Bearer tokens: accepted until a role, status or password change revokes them"""
+from itsdangerous import URLSafeTimedSerializer
+
+import backend
+from backend import app
+
+
+def check(client, headers):
+    return client.post('/api/auth/check', json={}, headers=headers)
+
+
+def test_token_authenticates(client, make_user, login):
+    user_id, username = make_user()
+    response = check(client, login(username))
+    assert response.status_code == 200
+    assert response.get_json()['user']['id'] == user_id
+
+
+def test_bad_token_is_401(client):
+    response = check(client, {'Authorization': 'Bearer not-a-token'})
+    assert response.status_code == 401
+    assert response.get_json()['error'] == 'Invalid token'
+
+
+def test_role_change_revokes_token(client, make_user, login):
+    user_id, username = make_user('seller')
+    token = login(username)
+    admin = login('admin', 'admin123')
+
+    response = client.put(f'/api/admin/users/{user_id}', json={'role': 'buyer'}, headers=admin)
+    assert response.status_code == 200
+
+    revoked = check(client, token)
+    assert revoked.status_code == 401
+    assert revoked.get_json()['error'] == 'Token revoked'
+    assert check(client, login(username)).get_json()['user']['role'] == 'buyer'
+
+
+def test_status_change_revokes_token(client, make_user, login):
+    user_id, username = make_user()
+    token = login(username)
+    admin = login('admin', 'admin123')
+
+    client.put(f'/api/admin/users/{user_id}', json={'status': 'inactive'}, headers=admin)
+
+    assert check(client, token).status_code == 401
+
+
+def test_unrelated_change_keeps_token(client, make_user, login):
+    user_id, username = make_user()
+    token = login(username)
+    admin = login('admin', 'admin123')
+
+    client.put(f'/api/admin/users/{user_id}', json={'full_name': 'New Name'}, headers=admin)
+
+    response = check(client, token)
+    assert response.status_code == 200
+    assert response.get_json()['user']['full_name'] == 'New Name'  # Served from a refreshed user cache
+
+
+def test_token_signed_with_another_key_is_401(client, make_user):
+    user_id, _ = make_user()
+    forged = URLSafeTimedSerializer(backend.DEFAULT_SECRET_KEY, salt='auth-token').dumps(
+        {'uid': user_id, 'name': 'admin', 'role': 'admin', 'status': 'active', 'ver': 0})
+    response = client.get('/api/admin/users', headers={'Authorization': f'Bearer {forged}'})
+    assert response.status_code == 401
+    assert response.get_json()['error'] == 'Invalid token'
+
+
+def test_default_key_disables_tokens(client, make_user, login, monkeypatch):
+    _, username = make_user()
+    token = login(username)
+    monkeypatch.setitem(app.config, 'SECRET_KEY', backend.DEFAULT_SECRET_KEY)
+
+    assert check(client, token).status_code == 401
+    response = client.post('/api/auth/login', json={'username': username, 'password': 'secret'})
+    assert response.status_code == 200
+    assert response.get_json()['token'] is None
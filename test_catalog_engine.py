@@ -0,0 +1,129 @@
+"""The in-memory catalog engine must return exactly what the SQL path returns"""
+import random
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+import backend
+from backend import app, db, Product, User
+
+pytest.importorskip('numpy')
+
+CATEGORY = 'Parity'  # Keeps these listings apart from other tests' products
+
+
+@pytest.fixture(scope='module')
+def catalog():
+    random.seed(7)
+    with app.app_context():
+        sellers = [User(username=f'parity-seller-{i}', email=f'parity{i}@example.com', role='seller',
+                        status='active', password_hash='x') for i in range(2)]
+        db.session.add_all(sellers)
+        db.session.commit()
+        seller_ids = [seller.id for seller in sellers]
+        rows = []
+        for i in range(300):
+            fixed = random.random() < 0.7
+            price = random.choice([None, round(random.uniform(1, 100), 1)])
+            count = random.randint(0, 3)
+            rows.append(dict(
+                name=f'Parity {i}', category=random.choice([CATEGORY, CATEGORY + ' B']),
+                priceType='fixed' if fixed else 'range', price=price if fixed else None,
+                priceMin=None if fixed else price, priceMax=None if fixed or price is None else price + 5,
+                sortPrice=price, sortPriceHigh=price if fixed or price is None else price + 5, uploader_id=random.choice(seller_ids),
+                createdAt=datetime(2024, 1, 1) + timedelta(minutes=random.randint(0, 40)),
+                rating_count=count, rating_sum=count * random.randint(1, 5)
+            ))
+        for price in (0.0, 10.0, 25.0, 50.0, 100.0, 250.0, 1000.0, 1500.0):  # On and past the facet edges
+            rows.append(dict(
+                name=f'Parity edge {price}', category=CATEGORY, priceType='fixed', price=price,
+                sortPrice=price, sortPriceHigh=price, uploader_id=seller_ids[1],
+                createdAt=datetime(2024, 1, 1), rating_count=0, rating_sum=0
+            ))
+        db.session.execute(db.insert(Product), rows)
+        db.session.commit()
+        backend.catalog_changed(0, seller_ids[0])
+        backend.catalog_engine.sync(wait=True)  # Until it has loaded, the engine path answers from SQL
+    yield seller_ids[0]
+    app.config['CATALOG_ENGINE'] = False
+
+
+def both(client, url):
+    results = []
+    for engine in (False, True):
+        app.config['CATALOG_ENGINE'] = engine
+        backend.response_cache.entries.clear()  # Otherwise the second path is a cache hit
+        response = client.get(url)
+        assert response.status_code == 200
+        results.append(response.get_json())
+    return results
+
+
+def ids(body):
+    return [product['id'] for product in body['products']]
+
+
+@pytest.mark.parametrize('sort', ['newest', 'price-low', 'price-high', 'rating'])
+@pytest.mark.parametrize('filters', ['', '&min_price=20&max_price=60', '&category=Parity B&min_price=50'])
+@pytest.mark.parametrize('window', ['&limit=7', '&limit=50&offset=13'])
+def test_search_parity(catalog, client, sort, filters, window):
+    category = '' if 'category=' in filters else f'&category={CATEGORY}'
+    sql, engine = both(client, f'/api/search?sort={sort}{category}{filters}{window}')
+    assert ids(sql)
+    assert ids(sql) == ids(engine)
+    assert (sql['has_more'], sql['next_offset']) == (engine['has_more'], engine['next_offset'])
+
+
+@pytest.mark.parametrize('filters', [
+    '', f'&category={CATEGORY}', '&min_price=20&max_price=60', '&category=Parity B&min_price=50',
+    '&min_price=25&max_price=25', '&category=No such category', '&max_price=0'
+])
+def test_facet_parity(catalog, client, filters):
+    sql, engine = both(client, f'/api/search?facets=1&limit=5{filters}')
+    assert sql['facets']['price']
+    assert sql['facets'] == engine['facets']
+    assert ids(sql) == ids(engine)
+
+
+def test_cursor_paging_parity(catalog, client):
+    pages = []
+    for engine in (False, True):
+        app.config['CATALOG_ENGINE'] = engine
+        backend.response_cache.entries.clear()
+        seen, cursor = [], None
+        while True:
+            url = f'/api/seller/{catalog}/products?limit=11' + (f'&cursor={cursor}' if cursor else '')
+            body = client.get(url).get_json()
+            seen += ids(body)
+            cursor = body['next_cursor']
+            if not cursor:
+                break
+        pages.append(seen)
+    assert pages[0] == pages[1]
+    assert len(set(pages[0])) == len(pages[0])
+
+
+def test_engine_builds_in_the_background(catalog, client, monkeypatch):
+    engine = backend.CatalogEngine(app.config['CATALOG_REFRESH_INTERVAL'])
+    release = threading.Event()
+    rebuild = backend.CatalogEngine._rebuild
+
+    def slow_rebuild(self, session, version):
+        release.wait(5)
+        rebuild(self, session, version)
+    monkeypatch.setattr(backend.CatalogEngine, '_rebuild', slow_rebuild)
+    monkeypatch.setattr(backend, 'catalog_engine', engine)
+    app.config['CATALOG_ENGINE'] = True
+    backend.response_cache.entries.clear()
+
+    response = client.get(f'/api/search?sort=newest&category={CATEGORY}&limit=5')
+    assert response.status_code == 200  # Answered from SQL, not held up by the build
+    assert len(ids(response.get_json())) == 5
+    assert engine.version is None and engine.building()
+
+    release.set()
+    with app.app_context():
+        engine.sync(wait=True)
+    assert engine.version is not None and not engine.building()
+    app.config['CATALOG_ENGINE'] = False
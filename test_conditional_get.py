@@ -0,0 +1,70 @@
+"""Catalog ETags: 304 on a match, fresh bodies and validators after writes from any worker"""
+import sqlite3
+
+import backend
+from backend import app, db
+
+
+def test_matching_etag_gets_304(client, make_user, make_product):
+    seller_id, _ = make_user('seller')
+    product_id = make_product(seller_id)
+
+    first = client.get(f'/api/products/{product_id}')
+    etag = first.headers['ETag']
+    again = client.get(f'/api/products/{product_id}', headers={'If-None-Match': etag})
+    assert again.status_code == 304
+
+
+def test_write_changes_etag(client, make_user, make_product):
+    seller_id, _ = make_user('seller')
+    product_id = make_product(seller_id)
+    etag = client.get(f'/api/products/{product_id}').headers['ETag']
+
+    client.put(f'/api/products/{product_id}', json={'user_id': seller_id, 'name': 'Changed'})
+
+    response = client.get(f'/api/products/{product_id}', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert response.get_json()['product']['name'] == 'Changed'
+
+
+def test_write_from_another_worker_is_not_served_under_new_etag(client, make_user, make_product, monkeypatch):
+    # The cache would not notice the other worker's write for an hour on its own
+    monkeypatch.setattr(backend.response_cache, 'refresh_interval', 3600)
+    seller_id, _ = make_user('seller')
+    product_id = make_product(seller_id, name='Before')
+    client.get(f'/api/products/{product_id}')
+    cached = client.get(f'/api/products/{product_id}')
+    assert cached.headers['X-Cache'] == 'HIT'
+
+    with app.app_context():
+        path = db.engines['products_db'].url.database
+    conn = sqlite3.connect(path)  # Bypasses this process's caches entirely
+    conn.execute("UPDATE product SET name = 'After' WHERE id = ?", (product_id,))
+    conn.commit()
+    conn.close()
+
+    response = client.get(f'/api/products/{product_id}')
+    assert response.headers['ETag'] != cached.headers['ETag']
+    assert response.get_json()['product']['name'] == 'After'
+    revalidated = client.get(f'/api/products/{product_id}', headers={'If-None-Match': cached.headers['ETag']})
+    assert revalidated.status_code == 200
+
+
+def test_write_in_same_second_defeats_if_modified_since(client, make_user, make_product):
+    seller_id, _ = make_user('seller')
+    product_id = make_product(seller_id)
+    last_modified = client.get(f'/api/products/{product_id}').headers['Last-Modified']
+
+    client.put(f'/api/products/{product_id}', json={'user_id': seller_id, 'name': 'Same second'})
+
+    response = client.get(f'/api/products/{product_id}', headers={'If-Modified-Since': last_modified})
+    assert response.status_code == 200
+    assert response.get_json()['product']['name'] == 'Same second'
+
+
+def test_if_modified_since_after_last_change_gets_304(client, make_user, make_product):
+    seller_id, _ = make_user('seller')
+    product_id = make_product(seller_id)
+    later = 'Fri, 01 Jan 2100 00:00:00 GMT'
+    assert client.get(f'/api/products/{product_id}', headers={'If-Modified-Since': later}).status_code == 304
@@ -0,0 +1,72 @@
+"""Idempotency-Key: replay, body mismatch, in-progress claims and expired leases"""
+import hashlib
+import json
+from datetime import datetime, timedelta
+
+from backend import app, db, IdempotencyKey, CartItem
+
+
+def post_cart(client, body, key):
+    return client.post('/api/cart', data=json.dumps(body), content_type='application/json',
+                       headers={'Idempotency-Key': key})
+
+
+def cart_quantity(user_id):
+    with app.app_context():
+        return sum(item.quantity for item in CartItem.query.filter_by(userId=user_id))
+
+
+def unfinished_claim(key, body, claimed_at):
+    """The row a worker killed mid-request leaves behind"""
+    with app.app_context():
+        db.session.add(IdempotencyKey(
+            scope='POST /api/cart', key=key,
+            requestHash=hashlib.sha256(json.dumps(body).encode()).hexdigest(),
+            claimedAt=claimed_at, expiresAt=datetime.utcnow() + timedelta(days=1)
+        ))
+        db.session.commit()
+
+
+def test_retry_replays_without_running_again(client, make_user, make_product):
+    buyer_id, _ = make_user()
+    body = {'user_id': buyer_id, 'product_id': make_product(make_user('seller')[0]), 'quantity': 1}
+
+    first = post_cart(client, body, 'replay-1')
+    retry = post_cart(client, body, 'replay-1')
+    assert first.status_code == 201
+    assert retry.status_code == 201
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert retry.get_data() == first.get_data()
+    assert cart_quantity(buyer_id) == 1
+
+
+def test_key_reused_with_different_body_is_rejected(client, make_user, make_product):
+    buyer_id, _ = make_user()
+    body = {'user_id': buyer_id, 'product_id': make_product(make_user('seller')[0]), 'quantity': 1}
+
+    post_cart(client, body, 'mismatch-1')
+    response = post_cart(client, {**body, 'quantity': 5}, 'mismatch-1')
+    assert response.status_code == 422
+    assert cart_quantity(buyer_id) == 1
+
+
+def test_claim_in_progress_gets_409(client, make_user, make_product):
+    buyer_id, _ = make_user()
+    body = {'user_id': buyer_id, 'product_id': make_product(make_user('seller')[0]), 'quantity': 1}
+    unfinished_claim('busy-1', body, datetime.utcnow())
+
+    assert post_cart(client, body, 'busy-1').status_code == 409
+    assert cart_quantity(buyer_id) == 0
+
+
+def test_expired_lease_is_taken_over(client, make_user, make_product):
+    buyer_id, _ = make_user()
+    body = {'user_id': buyer_id, 'product_id': make_product(make_user('seller')[0]), 'quantity': 1}
+    lease = app.config['IDEMPOTENCY_LEASE']
+    unfinished_claim('stale-1', body, datetime.utcnow() - timedelta(seconds=lease + 1))
+
+    taken_over = post_cart(client, body, 'stale-1')
+    assert taken_over.status_code == 201
+    assert 'Idempotent-Replayed' not in taken_over.headers
+    assert post_cart(client, body, 'stale-1').headers['Idempotent-Replayed'] == 'true'
+    assert cart_quantity(buyer_id) == 1
@@ -0,0 +1,76 @@
+"""Cursor paging of /api/products: every product exactly once, ties on createdAt included"""
+from datetime import datetime
+
+import pytest
+
+import backend
+
+
+@pytest.fixture
+def listing(make_user, make_product):
+    """A seller with 13 products sharing three createdAt values; returns (seller_id, ids newest first)"""
+    seller_id, _ = make_user('seller')
+    created = []
+    for i in range(13):
+        moment = datetime(2024, 5, 1 + i % 3, 12, 0, 0)
+        created.append((moment, make_product(seller_id, name=f'Paged {i}', createdAt=moment)))
+    return seller_id, [product_id for _, product_id in sorted(created, reverse=True)]
+
+
+def walk(client, seller_id, limit, **args):
+    seen, cursor, pages = [], None, 0
+    while True:
+        query = f'/api/products?seller_id={seller_id}&limit={limit}' + ''.join(f'&{k}={v}' for k, v in args.items())
+        response = client.get(query + (f'&cursor={cursor}' if cursor else ''))
+        assert response.status_code == 200
+        body = response.get_json()
+        assert len(body['products']) <= limit
+        seen += [product['id'] for product in body['products']]
+        pages += 1
+        cursor = body['next_cursor']
+        if not cursor:
+            return seen, pages, body
+
+
+@pytest.mark.parametrize('limit', [1, 4, 5, 13, 50])
+def test_pages_cover_every_product_once(client, listing, limit):
+    seller_id, expected = listing
+    seen, pages, _ = walk(client, seller_id, limit)
+    assert seen == expected  # Newest first, ties broken by id, no gaps or repeats
+    assert pages == max(1, -(-len(expected) // limit))
+
+
+def test_total_and_count_0(client, listing):
+    seller_id, expected = listing
+    body = client.get(f'/api/products?seller_id={seller_id}&limit=4').get_json()
+    assert body['total'] == len(expected)
+
+    seen, _, last = walk(client, seller_id, 4, count=0)
+    assert seen == expected
+    assert 'total' not in last
+
+
+def test_cursor_past_the_end(client, listing):
+    seller_id, expected = listing
+    cursor = backend.encode_cursor(datetime(2000, 1, 1), 1)
+    body = client.get(f'/api/products?seller_id={seller_id}&limit=4&cursor={cursor}').get_json()
+    assert body['products'] == [] and body['next_cursor'] is None
+
+
+@pytest.mark.parametrize('args, error', [
+    ('cursor=not-a-cursor', 'Invalid cursor'),
+    ('limit=abc', 'Invalid limit'),
+    ('limit=0', 'Invalid limit'),
+    ('limit=-3', 'Invalid limit'),
+])
+def test_bad_paging_args(client, args, error):
+    response = client.get(f'/api/products?{args}')
+    assert response.status_code == 400
+    assert response.get_json()['error'] == error
+
+
+def test_limit_is_capped(client, listing, monkeypatch):
+    seller_id, expected = listing
+    monkeypatch.setitem(backend.app.config, 'PAGE_SIZE_MAX', 5)
+    body = client.get(f'/api/products?seller_id={seller_id}&limit=1000').get_json()
+    assert [product['id'] for product in body['products']] == expected[:5]
@@ -0,0 +1,56 @@
+"""Password hashing: host-wide slot limit, the process pool and rehash on login"""
+import backend
+from backend import app, db, User, HashSlots
+
+
+def stored_hash(user_id):
+    with app.app_context():
+        return db.session.get(User, user_id).password_hash
+
+
+def test_all_slots_taken_gets_503(client, make_user, monkeypatch, tmp_path):
+    _, username = make_user()
+    monkeypatch.setattr(backend.password_hasher, 'slots', HashSlots(1, str(tmp_path)))
+    other_worker = HashSlots(1, str(tmp_path))  # Same slot files, as another gunicorn worker sees them
+    held = other_worker.acquire()
+    try:
+        response = client.post('/api/auth/login', json={'username': username, 'password': 'secret'})
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == str(app.config['PASSWORD_HASH_RETRY_AFTER'])
+    finally:
+        other_worker.release(held)
+
+    response = client.post('/api/auth/login', json={'username': username, 'password': 'secret'})
+    assert response.status_code == 200
+
+
+def test_slots_are_freed_after_each_hash(tmp_path):
+    slots = HashSlots(2, str(tmp_path))
+    first, second = slots.acquire(), slots.acquire()
+    assert first is not None and second is not None
+    assert slots.acquire() is None
+    slots.release(first)
+    assert slots.acquire() is not None
+
+
+def test_process_pool_hashes(client, make_user, monkeypatch):
+    monkeypatch.setitem(app.config, 'PASSWORD_HASH_WORKERS', 1)
+    monkeypatch.setattr(backend.password_hasher, 'pool', None)
+    try:
+        _, username = make_user()
+        response = client.post('/api/auth/login', json={'username': username, 'password': 'secret'})
+        assert response.status_code == 200
+        assert backend.password_hasher.pool is not None
+    finally:
+        backend.password_hasher.pool.shutdown()
+
+
+def test_login_rehashes_outdated_hash(client, make_user, monkeypatch):
+    user_id, username = make_user()
+    assert stored_hash(user_id).startswith('pbkdf2:sha256:1000$')
+
+    monkeypatch.setitem(app.config, 'PASSWORD_HASH_METHOD', 'pbkdf2:sha256:2000')
+    assert client.post('/api/auth/login', json={'username': username, 'password': 'secret'}).status_code == 200
+
+    assert stored_hash(user_id).startswith('pbkdf2:sha256:2000$')
+    assert client.post('/api/auth/login', json={'username': username, 'password': 'secret'}).status_code == 200
@@ -0,0 +1,104 @@
+"""Response cache: hits, and invalidation by product and seller writes"""
+import backend
+from backend import app
+
+
+def test_repeat_get_is_a_hit(client, make_user, make_product):
+    seller_id, _ = make_user('seller')
+    product_id = make_product(seller_id)
+
+    first = client.get(f'/api/products/{product_id}')
+    second = client.get(f'/api/products/{product_id}')
+    assert first.headers['X-Cache'] == 'MISS'
+    assert second.headers['X-Cache'] == 'HIT'
+    assert second.get_json() == first.get_json()
+
+
+def test_product_write_invalidates_cached_product(client, make_user, make_product):
+    seller_id, _ = make_user('seller')
+    product_id = make_product(seller_id, name='Old name')
+    assert client.get(f'/api/products/{product_id}').get_json()['product']['name'] == 'Old name'
+
+    response = client.put(f'/api/products/{product_id}', json={'user_id': seller_id, 'name': 'New name'})
+    assert response.status_code == 200
+
+    after = client.get(f'/api/products/{product_id}')
+    assert after.headers['X-Cache'] == 'MISS'
+    assert after.get_json()['product']['name'] == 'New name'
+
+
+def test_product_write_invalidates_seller_listing(client, make_user, make_product):
+    seller_id, _ = make_user('seller')
+    product_id = make_product(seller_id, name='Listed')
+    client.get(f'/api/seller/{seller_id}/products')
+
+    client.put(f'/api/products/{product_id}', json={'user_id': seller_id, 'name': 'Renamed'})
+
+    listing = client.get(f'/api/seller/{seller_id}/products').get_json()
+    assert [p['name'] for p in listing['products']] == ['Renamed']
+
+
+def test_hit_reuses_compressed_body(client, make_user, make_product, monkeypatch):
+    seller_id, _ = make_user('seller')
+    product_id = make_product(seller_id, description='x' * 5000)
+    calls = []
+    compress = backend.compress_body
+    monkeypatch.setattr(backend, 'compress_body', lambda body, encoding: calls.append(encoding) or compress(body, encoding))
+
+    first = client.get(f'/api/products/{product_id}', headers={'Accept-Encoding': 'gzip'})
+    second = client.get(f'/api/products/{product_id}', headers={'Accept-Encoding': 'gzip'})
+    assert second.headers['X-Cache'] == 'HIT'
+    assert second.headers['Content-Encoding'] == 'gzip'
+    assert second.get_data() == first.get_data()
+    assert calls == ['gzip']
+
+
+def test_invalidation_during_handler_is_not_cached():
+    cache = backend.response_cache
+    key = '/api/products/999999?'
+    with app.test_request_context(key):
+        generations = cache.tag_generations(['product:999999'])  # Taken before the handler reads
+        cache.invalidate('product:999999')  # A write lands while it runs
+        cache.set(key, generations, (b'{}', 'application/json', {}))
+        assert cache.get(key) is None
+
+
+def test_tag_generations_are_pruned():
+    cache = backend.ResponseCache(10, 60, 1.0, max_tags=3)
+    for product_id in range(10):
+        cache.invalidate(f'product:{product_id}')
+    assert len(cache.generations) <= 3
+
+
+def test_pruning_never_revives_a_stale_entry():
+    cache = backend.ResponseCache(10, 60, 1.0, max_tags=3)
+    with app.test_request_context('/api/products/1'):
+        generations = cache.tag_generations(['product:1'])
+        cache.invalidate('product:1')  # Written while the handler ran
+        for product_id in range(2, 10):
+            cache.invalidate(f'product:{product_id}')  # Enough writes to prune product:1
+        cache.set('/api/products/1?', generations, (b'{}', 'application/json', {}))
+        assert cache.get('/api/products/1?') is None
+
+        fresh = cache.tag_generations(['product:1'])
+        cache.set('/api/products/1?', fresh, (b'{}', 'application/json', {}))
+        assert cache.get('/api/products/1?') is not None
+
+
+def test_user_write_in_another_worker_reaches_seller_listing(client, make_user, make_product):
+    seller_id, _ = make_user('seller')
+    make_product(seller_id)
+    client.get(f'/api/seller/{seller_id}/products')  # Cached here, also seeds the stamp check
+    assert client.get(f'/api/seller/{seller_id}/products').headers['X-Cache'] == 'HIT'
+
+    with app.app_context():  # Another worker renames the shop and bumps the stamp
+        backend.User.query.filter_by(id=seller_id).update({'shop_name': 'Renamed shop'})
+        if not backend.UserCacheStamp.query.update({'version': backend.UserCacheStamp.version + 1}):
+            backend.db.session.add(backend.UserCacheStamp(id=1, version=1))
+        backend.db.session.commit()
+    backend.response_cache.checked_at = 0.0  # Refresh interval elapsed
+    backend.user_cache.checked_at = 0.0
+
+    listing = client.get(f'/api/seller/{seller_id}/products')
+    assert listing.headers['X-Cache'] == 'MISS'
+    assert listing.get_json()['seller']['shop_name'] == 'Renamed shop'
@@ -0,0 +1,33 @@
+"""/api/search paging signals and price ordering"""
+
+
+def search(client, query):
+    response = client.get('/api/search?' + query)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_pages_report_has_more_and_next_offset(client, make_user, make_product):
+    seller_id, _ = make_user('seller')
+    created = {make_product(seller_id, category='Paging') for _ in range(5)}
+
+    seen, offset = [], 0
+    while True:
+        page = search(client, f'category=Paging&limit=2&offset={offset}')
+        seen += [product['id'] for product in page['products']]
+        if not page['has_more']:
+            assert page['next_offset'] is None
+            break
+        offset = page['next_offset']
+    assert sorted(seen) == sorted(created)
+
+
+def test_price_high_ranks_ranges_by_their_high_end(client, make_user, make_product):
+    seller_id, _ = make_user('seller')
+    fixed = make_product(seller_id, category='Ranges', price=50.0)
+    wide = make_product(seller_id, category='Ranges', price=None, priceType='range', priceMin=10.0, priceMax=100.0)
+
+    ids = [product['id'] for product in search(client, 'category=Ranges&sort=price-high')['products']]
+    assert ids == [wide, fixed]
+    ids = [product['id'] for product in search(client, 'category=Ranges&sort=price-low')['products']]
+    assert ids == [wide, fixed]
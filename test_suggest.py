@@ -0,0 +1,54 @@
+"""Typeahead suggestions: both ranking paths agree, and writes show up in the index"""
+import os
+
+import pytest
+
+import backend
+from backend import app
+
+
+@pytest.fixture
+def prefix():
+    return 'zq' + os.urandom(3).hex()  # Keeps each test's products apart
+
+
+def suggest(client, query, limit=5):
+    response = client.get(f'/api/search/suggest?q={query}&limit={limit}')
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def names(body):
+    return [product['name'] for product in body['products']]
+
+
+def test_scan_and_rank_walk_agree(client, make_user, make_product, prefix, monkeypatch):
+    seller_id, _ = make_user('seller')
+    for i in range(12):
+        ratings = (i * 7) % 5
+        make_product(seller_id, name=f'{prefix}{i % 3} item {i}', rating_count=ratings, rating_sum=ratings * (1 + i % 5))
+    make_product(seller_id, name=f'Plain {prefix}x', rating_count=9, rating_sum=45)  # Matches on its second word
+
+    answers = []
+    for scan_max in (10 ** 6, 0):  # Scan every match, then walk by_rank from the top
+        monkeypatch.setitem(app.config, 'SUGGEST_SCAN_MAX', scan_max)
+        backend.suggest_index.results.clear()
+        answers.append((suggest(client, prefix), suggest(client, prefix + '1', limit=3)))
+    assert answers[0] == answers[1]
+    assert names(answers[0][0])[0] == f'Plain {prefix}x'
+    assert len(answers[0][0]['products']) == 5
+
+
+def test_rename_and_delete_reach_the_index(client, make_user, make_product, prefix):
+    seller_id, _ = make_user('seller')
+    product_id = make_product(seller_id, name=f'{prefix} lamp')
+    assert names(suggest(client, prefix)) == [f'{prefix} lamp']
+
+    response = client.put(f'/api/products/{product_id}', json={'user_id': seller_id, 'name': f'{prefix} desk'})
+    assert response.status_code == 200
+    assert names(suggest(client, prefix)) == [f'{prefix} desk']
+    assert f'{prefix} lamp' not in names(suggest(client, 'lamp', 20))
+
+    response = client.delete(f'/api/products/{product_id}?user_id={seller_id}')
+    assert response.status_code == 200
+    assert names(suggest(client, prefix)) == []
@@ -0,0 +1,43 @@
+"""User cache: local invalidation and pick-up of other workers' writes via the stamp"""
+import sqlite3
+
+import backend
+from backend import app, db
+
+
+def check(client, user_id):
+    return client.post('/api/auth/check', json={'user_id': user_id}).get_json()
+
+
+def test_lookups_are_cached(client, make_user):
+    user_id, _ = make_user()
+    hits = backend.user_cache.hits
+    check(client, user_id)
+    check(client, user_id)
+    assert backend.user_cache.hits == hits + 1
+
+
+def test_admin_edit_invalidates(client, make_user, login):
+    user_id, _ = make_user()
+    assert check(client, user_id)['user']['full_name'] in ('', None)
+
+    client.put(f'/api/admin/users/{user_id}', json={'full_name': 'Edited'}, headers=login('admin', 'admin123'))
+
+    assert check(client, user_id)['user']['full_name'] == 'Edited'
+
+
+def test_other_worker_write_is_seen_after_stamp_bump(client, make_user, monkeypatch):
+    monkeypatch.setattr(backend.user_cache, 'refresh_interval', 0)
+    user_id, _ = make_user()
+    check(client, user_id)
+
+    with app.app_context():
+        path = db.engines['auth_db'].url.database
+    conn = sqlite3.connect(path)  # Another worker: writes the row and bumps the stamp
+    conn.execute("UPDATE user SET full_name = 'Elsewhere' WHERE id = ?", (user_id,))
+    if not conn.execute("UPDATE user_cache_stamp SET version = version + 1").rowcount:
+        conn.execute("INSERT INTO user_cache_stamp (id, version) VALUES (1, 1)")
+    conn.commit()
+    conn.close()
+
+    assert check(client, user_id)['user']['full_name'] == 'Elsewhere'
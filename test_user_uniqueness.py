@@ -0,0 +1,63 @@
+"""Taken usernames and emails are rejected by the unique constraints with a clear error"""
+import pytest
+
+from backend import app, db, User
+
+
+def count_users():
+    with app.app_context():
+        return User.query.count()
+
+
+def signup(client, username, email):
+    return client.post('/api/auth/signup', json={'username': username, 'email': email, 'password': 'secret'})
+
+
+@pytest.mark.parametrize('field, error', [('username', 'Username already exists'), ('email', 'Email already exists')])
+def test_signup_rejects_taken(client, make_user, field, error):
+    _, taken = make_user()
+    fields = {'username': 'fresh-user', 'email': 'fresh-user@example.com'}
+    fields[field] = taken if field == 'username' else f'{taken}@example.com'
+    before = count_users()
+
+    response = signup(client, fields['username'], fields['email'])
+    assert response.status_code == 400
+    assert response.get_json()['error'] == error
+    assert count_users() == before
+
+
+@pytest.mark.parametrize('field, error', [('username', 'Username already exists'), ('email', 'Email already exists')])
+def test_admin_create_seller_rejects_taken(client, make_user, login, field, error):
+    _, taken = make_user()
+    fields = {'username': 'fresh-seller', 'email': 'fresh-seller@example.com'}
+    fields[field] = taken if field == 'username' else f'{taken}@example.com'
+    before = count_users()
+
+    response = client.post('/api/admin/sellers', json={**fields, 'password': 'secret'},
+                           headers=login('admin', 'admin123'))
+    assert response.status_code == 400
+    assert response.get_json()['error'] == error
+    assert count_users() == before
+
+
+@pytest.mark.parametrize('field, error', [('username', 'Username already exists'), ('email', 'Email already exists')])
+def test_admin_update_rejects_taken(client, make_user, login, field, error):
+    user_id, username = make_user()
+    _, taken = make_user()
+    value = taken if field == 'username' else f'{taken}@example.com'
+
+    response = client.put(f'/api/admin/users/{user_id}', json={field: value}, headers=login('admin', 'admin123'))
+    assert response.status_code == 400
+    assert response.get_json()['error'] == error
+    with app.app_context():
+        user = db.session.get(User, user_id)
+        assert (user.username, user.email) == (username, f'{username}@example.com')
+
+
+def test_admin_update_keeps_own_username_and_email(client, make_user, login):
+    user_id, username = make_user()
+    response = client.put(f'/api/admin/users/{user_id}',
+                          json={'username': username, 'email': f'{username}@example.com', 'full_name': 'Same'},
+                          headers=login('admin', 'admin123'))
+    assert response.status_code == 200
+    assert response.get_json()['user']['full_name'] == 'Same'